@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# coding: UTF-8
+# JSON lines server for LawSemAnalyser's Liner2Daemon client, the entrypoint
+# of liner2_backend="daemon". Requests and responses are single lines of
+# UTF-8 JSON:
+#   -> {"text": "..."}
+#   <- {"liner2": {"chunks": [...], "annotations": [...]}} or {"error": "..."}
+#
+# The texts are annotated by long-lived `liner2-cli interactive` processes,
+# which load the models once, at start-up, and then read one text per line
+# from stdin and write its output to stdout. They get the options
+# liner2-batch.sh passes to liner2-cli (model, input and output format), so
+# the output is in the same format as with the batch backend; LINER2_COMMAND
+# replaces the whole command. The port is only opened once every process
+# has annotated a first text, so a client's first round trip means ready.
+# Empty texts are answered without Liner2.
+# Runs on the image's Python 3.5.
+import codecs
+import collections
+import json
+import os
+import queue
+import re
+import shlex
+import socketserver
+import subprocess
+import sys
+
+PORT = int(os.environ.get("LINER2_PORT", "9999"))
+PROCESSES = int(os.environ.get("LINER2_PROCESSES", "1"))
+LINER2_CLI = "/liner2/liner2-cli"
+BATCH_SCRIPT = "/liner2/liner2-batch.sh"
+# liner2-cli options naming the batch's input and output files
+FILE_OPTIONS = ("-f", "-t")
+WARM_UP_TEXT = "Ustawa wchodzi w życie z dniem 1 stycznia 2020 r."
+EMPTY_OUTPUT = collections.OrderedDict([("chunks", []), ("annotations", [])])
+READ_SIZE = 65536
+
+
+def liner2_command():
+    if "LINER2_COMMAND" in os.environ:
+        return shlex.split(os.environ["LINER2_COMMAND"])
+    with open(BATCH_SCRIPT, encoding="utf8") as f:
+        calls = [x.split("liner2-cli", 1)[1] for x in f if "liner2-cli" in x]
+    if not calls:
+        sys.exit("No liner2-cli call in %s, set LINER2_COMMAND" % BATCH_SCRIPT)
+    # liner2-cli MODE -OPTION VALUE ..., up to the end of the command, minus
+    # the file options; a call quoted as a whole (e.g. parallel's command)
+    # leaves an unbalanced quote behind it
+    try:
+        words = shlex.split(calls[0], comments=True)[1:]
+    except ValueError:
+        words = shlex.split(re.sub("[\"']", " ", calls[0]), comments=True)[1:]
+    options = []
+    for option, value in zip(words[::2], words[1::2]):
+        if not option.startswith("-"):
+            break
+        if option not in FILE_OPTIONS:
+            options += [option, value]
+    return [LINER2_CLI, "interactive"] + options
+
+
+class Liner2Process(object):
+    # one liner2-cli process; the output of a text is the first complete
+    # JSON value it writes after the text, anything before it (prompts,
+    # log lines) is skipped
+    def __init__(self, command):
+        self.command = command
+        self.process = None
+        self.buffer = ""
+        # keeps the keys in order on Python 3.5 as well
+        self.decoder = json.JSONDecoder(object_pairs_hook=collections.OrderedDict)
+        self.reader = None
+
+    def annotate(self, text):
+        # one text per line
+        text = " ".join(text.split())
+        if not text:
+            return EMPTY_OUTPUT
+        if self.process is None:
+            self.start()
+        try:
+            return self._request(text)
+        except Exception:
+            self.stop()
+            raise
+
+    def start(self):
+        # relative paths, e.g. of the model, are as in liner2-batch.sh
+        self.process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=os.path.dirname(LINER2_CLI),
+        )
+        self.buffer = ""
+        self.reader = codecs.getincrementaldecoder("utf8")("replace")
+        self._request(WARM_UP_TEXT)
+
+    def stop(self):
+        if self.process:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+    def _request(self, text):
+        self.process.stdin.write(text.encode("utf8") + b"\n")
+        self.process.stdin.flush()
+        stdout = self.process.stdout.fileno()
+        # whatever is left of the last read may already hold the output
+        data = self.buffer
+        while True:
+            start = self.buffer.find("{")
+            if start >= 0 and "}" in data:
+                try:
+                    output, end = self.decoder.raw_decode(self.buffer, start)
+                except ValueError:
+                    pass
+                else:
+                    self.buffer = self.buffer[end:]
+                    return output
+            data = os.read(stdout, READ_SIZE)
+            if not data:
+                raise RuntimeError("Liner2 exited with code %s" % self.process.wait())
+            data = self.reader.decode(data)
+            self.buffer += data
+
+
+processes = queue.Queue()
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                text = json.loads(line.decode("utf8"))["text"]
+            except (ValueError, KeyError, TypeError) as e:
+                response = {"error": "Bad request: %s" % e}
+            else:
+                process = processes.get()
+                try:
+                    response = {"liner2": process.annotate(text)}
+                except Exception as e:
+                    response = {"error": "Liner2 failed: %s" % e}
+                finally:
+                    processes.put(process)
+            self.wfile.write(
+                json.dumps(response, ensure_ascii=False).encode("utf8") + b"\n"
+            )
+
+
+def main():
+    command = liner2_command()
+    for _ in range(PROCESSES):
+        process = Liner2Process(command)
+        process.start()
+        processes.put(process)
+    server = socketserver.ThreadingTCPServer(("0.0.0.0", PORT), Handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
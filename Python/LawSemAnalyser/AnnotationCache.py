@@ -0,0 +1,84 @@
+# coding: UTF-8
+import hashlib
+import json
+import os
+import tempfile
+
+
+class AnnotationCache(object):
+    # Liner2 output stored on disk under a hash of the text it was produced
+    # from and of the Liner2 image, so a new image never reuses old results.
+    # Entries are touched on every hit and the least recently used ones are
+    # evicted once the cache grows over max_size bytes.
+    EVICT_TO = 0.9
+
+    def __init__(self, path: str, max_size=1024 ** 3, salt=""):
+        self.path = path
+        self.max_size = max_size
+        self.salt = salt
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        self.size = sum(os.path.getsize(x) for x in self._iter_entries())
+
+    @staticmethod
+    def normalise(text: str) -> str:
+        # exactly what is sent to Liner2
+        return text.strip()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(
+            f"{self.salt}\0{self.normalise(text)}".encode("utf8")
+        ).hexdigest()
+
+    def get(self, text: str):
+        path = self._entry_path(self.key(text))
+        try:
+            with open(path, "r", encoding="utf8") as f:
+                liner2_output = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return liner2_output
+
+    def put(self, text: str, liner2_output: dict):
+        path = self._entry_path(self.key(text))
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf8") as f:
+            json.dump(liner2_output, f, ensure_ascii=False, separators=(",", ":"))
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(temp_path, path)
+        self.size += os.path.getsize(path) - previous_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        entries = sorted(
+            (os.stat(x).st_mtime, os.path.getsize(x), x) for x in self._iter_entries()
+        )
+        self.size = sum(x[1] for x in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_size * self.EVICT_TO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key + ".json")
+
+    def _iter_entries(self):
+        for directory in os.scandir(self.path):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith(".json"):
+                    yield entry.path
@@ -0,0 +1,270 @@
+# coding: UTF-8
+import base64
+import itertools
+import json
+
+from .JSONEngine import JSONEngine
+
+
+class ColumnarOutput(object):
+    # Analysis output with the Liner2 tokens of every element stored in
+    # columns instead of one object per token:
+    #   "sentences"  token counts of the sentences, a list per chunk
+    #   "orth"       string table index of every token
+    #   "ns"         no-space flag of every token, a base64 bit array
+    #   "lexems"     lexem count of every token, left out when all are 1
+    #   "ctag", "base", "disamb"  the same for every lexem
+    #   "annotations"  [type, text, first token index, token count], with a
+    #                  negative count for tokens listed last to first and a
+    #                  list of token indices instead when neither holds
+    # Strings come from one table per document. Token and annotation ids are
+    # implied by position; output that does not fit is kept as {"raw": ...}.
+    FORMAT = "columnar"
+    VERSION = 1
+
+    TOP_KEYS = ["chunks", "annotations"]
+    TOKEN_KEYS = ["orth", "ns", "id", "lexems"]
+    LEXEM_KEYS = ["ctag", "disamb", "base"]
+    ANNOTATION_KEYS = ["tokens", "id", "text", "type"]
+    # the bits of every byte value, lowest first
+    BYTE_BITS = [tuple(bool(x >> i & 1) for i in range(8)) for x in range(256)]
+
+    @classmethod
+    def dump(cls, result: dict, output_file):
+        json.dump(
+            cls.encode(result), output_file, ensure_ascii=False, separators=(",", ":")
+        )
+
+    @classmethod
+    def load(cls, path: str, decode=True, json_engine=None) -> dict:
+        # plain JSON output is returned as it is, so either format can be read,
+        # compressed or not
+        data = (json_engine or JSONEngine()).load(path)
+        if decode and cls.is_columnar(data):
+            return cls.decode(data)
+        return data
+
+    @classmethod
+    def is_columnar(cls, data: dict) -> bool:
+        return data.get("format") == cls.FORMAT
+
+    @classmethod
+    def encode(cls, result: dict) -> dict:
+        strings = {}
+        document = {}
+        for part, elements in result["document"].items():
+            document[part] = [cls._encode_element(x, strings) for x in elements]
+        return {
+            "format": cls.FORMAT,
+            "version": cls.VERSION,
+            "type": result["type"],
+            "strings": list(strings),
+            "document": document,
+        }
+
+    @classmethod
+    def decode(cls, data: dict) -> dict:
+        strings = data["strings"]
+        document = {}
+        for part, elements in data["document"].items():
+            document[part] = [cls.decode_element(x, strings) for x in elements]
+        return {"type": data["type"], "document": document}
+
+    @classmethod
+    def decode_element(cls, element: dict, strings: list) -> dict:
+        if "liner2" not in element:
+            return element
+        return dict(element, liner2=cls.decode_liner2(element["liner2"], strings))
+
+    @classmethod
+    def decode_liner2(cls, columns, strings: list):
+        if columns is None:
+            return None
+        if "raw" in columns:
+            return columns["raw"]
+        return {
+            "chunks": cls.decode_chunks(columns, strings),
+            "annotations": cls.decode_annotations(columns, strings),
+        }
+
+    @classmethod
+    def decode_chunks(cls, columns, strings: list) -> list:
+        token_count = len(columns["orth"])
+        lexems = [
+            {"ctag": strings[ctag], "disamb": disamb, "base": strings[base]}
+            for ctag, disamb, base in zip(
+                columns["ctag"],
+                cls._unpack_bits(columns["disamb"], len(columns["ctag"])),
+                columns["base"],
+            )
+        ]
+        if "lexems" in columns:
+            token_lexems = []
+            lexem = 0
+            for lexem_count in columns["lexems"]:
+                token_lexems.append(lexems[lexem : lexem + lexem_count])
+                lexem += lexem_count
+        else:
+            token_lexems = [[x] for x in lexems]
+        tokens = [
+            {"orth": strings[orth], "ns": ns, "id": f"t{i}", "lexems": lexems}
+            for i, orth, ns, lexems in zip(
+                range(1, token_count + 1),
+                columns["orth"],
+                cls._unpack_bits(columns["ns"], token_count),
+                token_lexems,
+            )
+        ]
+        chunks = []
+        token = 0
+        for sentence_lengths in columns["sentences"]:
+            sentences = []
+            for sentence_length in sentence_lengths:
+                sentences.append({"tokens": tokens[token : token + sentence_length]})
+                token += sentence_length
+            chunks.append({"sentences": sentences})
+        return chunks
+
+    @classmethod
+    def decode_annotations(cls, columns, strings: list) -> list:
+        annotations = []
+        for i, annotation in enumerate(columns["annotations"], 1):
+            if len(annotation) == 3:
+                indices = annotation[2]
+            elif annotation[3] >= 0:
+                indices = range(annotation[2], annotation[2] + annotation[3])
+            else:
+                indices = range(annotation[2], annotation[2] + annotation[3], -1)
+            annotations.append(
+                {
+                    "tokens": [f"t{x + 1}" for x in indices],
+                    "id": f"a{i}",
+                    "text": strings[annotation[1]],
+                    "type": strings[annotation[0]],
+                }
+            )
+        return annotations
+
+    @classmethod
+    def _encode_element(cls, element: dict, strings: dict) -> dict:
+        if "liner2" not in element:
+            return element
+        return dict(element, liner2=cls.encode_liner2(element["liner2"], strings))
+
+    @classmethod
+    def encode_liner2(cls, liner2_output, strings: dict):
+        if liner2_output is None:
+            return None
+        try:
+            return cls._encode_columns(liner2_output, strings)
+        except (KeyError, TypeError, ValueError):
+            return {"raw": liner2_output}
+
+    @classmethod
+    def _encode_columns(cls, liner2_output: dict, strings: dict) -> dict:
+        # raises ValueError for anything decode_liner2 would not give back as is
+        cls._check_keys(liner2_output, cls.TOP_KEYS)
+        sentences = []
+        orth = []
+        ns = []
+        lexem_counts = []
+        ctag = []
+        base = []
+        disamb = []
+        for chunk in liner2_output["chunks"]:
+            cls._check_keys(chunk, ["sentences"])
+            sentence_lengths = []
+            for sentence in chunk["sentences"]:
+                cls._check_keys(sentence, ["tokens"])
+                sentence_lengths.append(len(sentence["tokens"]))
+                for token in sentence["tokens"]:
+                    cls._check_keys(token, cls.TOKEN_KEYS)
+                    if token["id"] != f"t{len(orth) + 1}":
+                        raise ValueError(token["id"])
+                    orth.append(cls._string_index(token["orth"], strings))
+                    ns.append(cls._check_bool(token["ns"]))
+                    lexem_counts.append(len(token["lexems"]))
+                    for lexem in token["lexems"]:
+                        cls._check_keys(lexem, cls.LEXEM_KEYS)
+                        ctag.append(cls._string_index(lexem["ctag"], strings))
+                        base.append(cls._string_index(lexem["base"], strings))
+                        disamb.append(cls._check_bool(lexem["disamb"]))
+            sentences.append(sentence_lengths)
+
+        annotations = []
+        for i, annotation in enumerate(liner2_output["annotations"]):
+            cls._check_keys(annotation, cls.ANNOTATION_KEYS)
+            if annotation["id"] != f"a{i + 1}":
+                raise ValueError(annotation["id"])
+            indices = [cls._token_index(x, len(orth)) for x in annotation["tokens"]]
+            encoded = [
+                cls._string_index(annotation["type"], strings),
+                cls._string_index(annotation["text"], strings),
+            ]
+            start = indices[0]
+            if indices == list(range(start, start + len(indices))):
+                encoded.extend([start, len(indices)])
+            elif indices == list(range(start, start - len(indices), -1)):
+                encoded.extend([start, -len(indices)])
+            else:
+                encoded.append(indices)
+            annotations.append(encoded)
+
+        columns = {
+            "sentences": sentences,
+            "orth": orth,
+            "ns": cls._pack_bits(ns),
+            "lexems": lexem_counts,
+            "ctag": ctag,
+            "base": base,
+            "disamb": cls._pack_bits(disamb),
+            "annotations": annotations,
+        }
+        if all(x == 1 for x in lexem_counts):
+            del columns["lexems"]
+        return columns
+
+    @staticmethod
+    def _check_keys(data: dict, keys: list):
+        if list(data) != keys:
+            raise ValueError(list(data))
+
+    @staticmethod
+    def _check_bool(value) -> bool:
+        if not isinstance(value, bool):
+            raise ValueError(value)
+        return value
+
+    @staticmethod
+    def _token_index(token_id: str, token_count: int) -> int:
+        index = int(token_id[1:]) - 1
+        if token_id != f"t{index + 1}" or not 0 <= index < token_count:
+            raise ValueError(token_id)
+        return index
+
+    @staticmethod
+    def _string_index(string: str, strings: dict) -> int:
+        if not isinstance(string, str):
+            raise ValueError(string)
+        index = strings.get(string)
+        if index is None:
+            index = strings[string] = len(strings)
+        return index
+
+    @staticmethod
+    def _pack_bits(bits: list) -> str:
+        packed = bytearray((len(bits) + 7) // 8)
+        for i, bit in enumerate(bits):
+            if bit:
+                packed[i >> 3] |= 1 << (i & 7)
+        return base64.b64encode(bytes(packed)).decode("ascii")
+
+    @classmethod
+    def _unpack_bits(cls, data: str, count: int) -> list:
+        bits = list(
+            itertools.chain.from_iterable(
+                map(cls.BYTE_BITS.__getitem__, base64.b64decode(data))
+            )
+        )
+        del bits[count:]
+        return bits
@@ -0,0 +1,297 @@
+# coding: UTF-8
+import json
+import os
+import shutil
+
+
+class CorpusIndex(object):
+    # On-disk inverted index over the Liner2 output of analysed documents.
+    # Terms are lemmas ("l:" + lowercased base of the disambiguated lexems),
+    # annotation types ("t:" + type) and annotation texts ("e:" + lowercased
+    # text). A posting is (document, element, token position), an annotation
+    # being posted at its first token.
+    #
+    # Every update writes a new segment, where each term maps to its postings
+    # sorted and delta encoded as varints. A re-analysed document gets a new
+    # number and the old one is marked deleted. Segments are merged, dropping
+    # deleted documents, once there are more than max_segments of them.
+    VERSION = 1
+    INDEX_NAME = "index.json"
+    TERMS_NAME = "terms.json"
+    POSTINGS_NAME = "postings.bin"
+    SEGMENT_PREFIX = "segment_"
+
+    def __init__(self, path: str, max_segments=8):
+        self.path = path
+        self.max_segments = max_segments
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        self.index_path = os.path.join(self.path, self.INDEX_NAME)
+        self.index = self._load_index()
+        self._terms = {}
+
+    @staticmethod
+    def lemma_term(lemma: str) -> str:
+        return "l:" + lemma.lower()
+
+    @staticmethod
+    def type_term(type_str: str) -> str:
+        return "t:" + type_str
+
+    @staticmethod
+    def entity_term(text: str) -> str:
+        return "e:" + text.lower()
+
+    def documents(self) -> list:
+        return sorted(self.index["documents"])
+
+    def update(self, html_data: dict):
+        # html_data maps document names to their analysis results
+        postings = {}
+        for name, data in html_data.items():
+            previous = self.index["documents"].get(name)
+            if previous is not None:
+                self.index["deleted"].append(previous)
+            number = self.index["next_document"]
+            self.index["next_document"] += 1
+            self.index["documents"][name] = number
+            elements = data["document"]["body"] + data["document"]["glossary"]
+            self.index["document_table"][str(number)] = {
+                "name": name,
+                "elements": [[x["type"], x["id"]] for x in elements],
+            }
+            for element_number, element in enumerate(elements):
+                for term, position in self._iter_terms(element.get("liner2")):
+                    postings.setdefault(term, []).append(
+                        (number, element_number, position)
+                    )
+        if postings:
+            self._write_segment(postings)
+        self._save_index()
+        if len(self.index["segments"]) > self.max_segments:
+            self.merge()
+
+    def remove(self, name: str):
+        number = self.index["documents"].pop(name, None)
+        if number is not None:
+            self.index["deleted"].append(number)
+            self._save_index()
+
+    def merge(self):
+        # rewrites all segments as one, without deleted documents
+        segments = self.index["segments"]
+        deleted = set(self.index["deleted"])
+        postings = {}
+        for segment in segments:
+            for term in self._load_terms(segment):
+                postings.setdefault(term, []).extend(
+                    x for x in self._read_postings(segment, term) if x[0] not in deleted
+                )
+        postings = {k: v for k, v in postings.items() if v}
+        self.index["segments"] = []
+        if postings:
+            self._write_segment(postings)
+        for number in deleted:
+            self.index["document_table"].pop(str(number), None)
+        self.index["deleted"] = []
+        self._save_index()
+        for segment in segments:
+            shutil.rmtree(os.path.join(self.path, segment))
+            self._terms.pop(segment, None)
+
+    def postings(self, term: str) -> list:
+        # [(document name, element type, element id, position), ...]
+        return [self._resolve(x) + (x[2],) for x in self._postings(term)]
+
+    def search(self, terms: list) -> list:
+        # elements containing all terms
+        # [(document name, element type, element id), ...] in document order
+        elements = None
+        for term in sorted(terms, key=self._count):
+            found = {x[:2] for x in self._postings(term)}
+            elements = found if elements is None else elements & found
+            if not elements:
+                return []
+        return [self._resolve(x) for x in sorted(elements or [])]
+
+    def phrase(self, lemmas: list) -> list:
+        # elements where the lemmas follow one another, in this order
+        return self._positional(
+            [self.lemma_term(x) for x in lemmas],
+            lambda positions: any(
+                all(x + i in positions[i] for i in range(1, len(positions)))
+                for x in positions[0]
+            ),
+        )
+
+    def near(self, first: str, second: str, distance=5) -> list:
+        # elements where the two terms are at most distance tokens apart
+        return self._positional(
+            [first, second],
+            lambda positions: any(
+                abs(x - y) <= distance for x in positions[0] for y in positions[1]
+            ),
+        )
+
+    def _positional(self, terms: list, matches) -> list:
+        positions = []
+        elements = None
+        for term in terms:
+            term_positions = {}
+            for document, element, position in self._postings(term):
+                term_positions.setdefault((document, element), set()).add(position)
+            positions.append(term_positions)
+            elements = (
+                set(term_positions)
+                if elements is None
+                else elements & set(term_positions)
+            )
+            if not elements:
+                return []
+        return [
+            self._resolve(x)
+            for x in sorted(elements or [])
+            if matches([y[x] for y in positions])
+        ]
+
+    def _iter_terms(self, liner2_output):
+        if not liner2_output:
+            return
+        position = 0
+        for chunk in liner2_output["chunks"]:
+            for sentence in chunk["sentences"]:
+                for token in sentence["tokens"]:
+                    lexems = [x for x in token["lexems"] if x["disamb"]]
+                    for lemma in {x["base"].lower() for x in lexems or token["lexems"]}:
+                        yield "l:" + lemma, position
+                    position += 1
+        for annotation in liner2_output["annotations"]:
+            start = min(int(x[1:]) - 1 for x in annotation["tokens"])
+            yield self.type_term(annotation["type"]), start
+            yield self.entity_term(annotation["text"]), start
+
+    def _postings(self, term: str) -> list:
+        deleted = set(self.index["deleted"])
+        postings = []
+        for segment in self.index["segments"]:
+            postings.extend(
+                x for x in self._read_postings(segment, term) if x[0] not in deleted
+            )
+        return postings
+
+    def _count(self, term: str) -> int:
+        return sum(
+            self._load_terms(x).get(term, (0, 0, 0))[2] for x in self.index["segments"]
+        )
+
+    def _resolve(self, posting: tuple) -> tuple:
+        document = self.index["document_table"][str(posting[0])]
+        return (document["name"],) + tuple(document["elements"][posting[1]])
+
+    def _write_segment(self, postings: dict):
+        segment = f"{self.SEGMENT_PREFIX}{self.index['next_segment']:08d}"
+        self.index["next_segment"] += 1
+        segment_path = os.path.join(self.path, segment)
+        os.makedirs(segment_path)
+        terms = {}
+        offset = 0
+        with open(os.path.join(segment_path, self.POSTINGS_NAME), "wb") as f:
+            for term in sorted(postings):
+                encoded = self._encode_postings(sorted(postings[term]))
+                f.write(encoded)
+                terms[term] = [offset, len(encoded), len(postings[term])]
+                offset += len(encoded)
+        with open(
+            os.path.join(segment_path, self.TERMS_NAME), "w", encoding="utf8"
+        ) as f:
+            json.dump(terms, f, ensure_ascii=False, separators=(",", ":"))
+        self.index["segments"].append(segment)
+        self._terms[segment] = terms
+
+    def _load_terms(self, segment: str) -> dict:
+        if segment not in self._terms:
+            with open(
+                os.path.join(self.path, segment, self.TERMS_NAME), "r", encoding="utf8"
+            ) as f:
+                self._terms[segment] = json.load(f)
+        return self._terms[segment]
+
+    def _read_postings(self, segment: str, term: str) -> list:
+        entry = self._load_terms(segment).get(term)
+        if not entry:
+            return []
+        offset, length, _ = entry
+        with open(os.path.join(self.path, segment, self.POSTINGS_NAME), "rb") as f:
+            f.seek(offset)
+            return self._decode_postings(f.read(length))
+
+    @staticmethod
+    def _encode_postings(postings: list) -> bytes:
+        # (document, element, position) triples as varints; the document as a
+        # delta, the element as a delta within the same document and the
+        # position as a delta within the same element
+        encoded = bytearray()
+        last = (0, 0, 0)
+        for posting in postings:
+            if posting[0] != last[0]:
+                values = (posting[0] - last[0], posting[1], posting[2])
+            elif posting[1] != last[1]:
+                values = (0, posting[1] - last[1], posting[2])
+            else:
+                values = (0, 0, posting[2] - last[2])
+            for value in values:
+                while value > 0x7F:
+                    encoded.append(value & 0x7F | 0x80)
+                    value >>= 7
+                encoded.append(value)
+            last = posting
+        return bytes(encoded)
+
+    @staticmethod
+    def _decode_postings(encoded: bytes) -> list:
+        values = []
+        value = 0
+        shift = 0
+        for byte in encoded:
+            value |= (byte & 0x7F) << shift
+            if byte & 0x80:
+                shift += 7
+                continue
+            values.append(value)
+            value = 0
+            shift = 0
+        postings = []
+        document = element = position = 0
+        for i in range(0, len(values), 3):
+            document_delta, element_value, position_value = values[i : i + 3]
+            if document_delta:
+                document += document_delta
+                element = element_value
+                position = position_value
+            elif element_value:
+                element += element_value
+                position = position_value
+            else:
+                position += position_value
+            postings.append((document, element, position))
+        return postings
+
+    def _load_index(self) -> dict:
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf8") as f:
+                return json.load(f)
+        return {
+            "version": self.VERSION,
+            "next_document": 0,
+            "next_segment": 0,
+            "segments": [],
+            "documents": {},
+            "document_table": {},
+            "deleted": [],
+        }
+
+    def _save_index(self):
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf8") as f:
+            json.dump(self.index, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temp_path, self.index_path)
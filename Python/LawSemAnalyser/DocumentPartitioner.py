@@ -0,0 +1,47 @@
+# coding: UTF-8
+import lxml.html
+from lxml import etree
+
+from .LXMLExtractor import LXMLExtractor
+
+
+class DocumentPartitioner(object):
+    # Splits an act into partitions of about partition_size characters of
+    # HTML that are extracted on their own and put back together in order.
+    # A partition holds whole units (see ISAPLawDoc.find_units): the head
+    # (title, subtitle and introduction), chapters, paragraphs, glosses and
+    # appendices. Units are found on a quick lxml parse and serialised from
+    # it; either extractor then reads a partition with read_html and
+    # extracts it with extract_html_part(soup, units), units being the
+    # (kind, node count) of each unit, whose nodes are the top level tags of
+    # the partition.
+    def __init__(self, partition_size: int):
+        self.partition_size = partition_size
+        self.extractor = LXMLExtractor()
+
+    def read_html(self, input_file) -> etree._Element:
+        return self.extractor.read_html(input_file)
+
+    def split(self, tree: etree._Element) -> list:
+        # [(units, html), ...]
+        units = self.extractor.ISAPLawDoc.find_units(
+            self.extractor, tree.find(".//body")
+        )
+        partitions = []
+        partition_units = []
+        partition_html = []
+        size = 0
+        for kind, nodes in units:
+            html = [lxml.html.tostring(x, encoding=str, with_tail=False) for x in nodes]
+            unit_size = sum(len(x) for x in html)
+            if partition_units and size + unit_size > self.partition_size:
+                partitions.append((partition_units, "".join(partition_html)))
+                partition_units = []
+                partition_html = []
+                size = 0
+            partition_units.append((kind, len(nodes)))
+            partition_html.extend(html)
+            size += unit_size
+        if partition_units:
+            partitions.append((partition_units, "".join(partition_html)))
+        return partitions
@@ -0,0 +1,145 @@
+# coding: UTF-8
+# Offline stand-ins for Liner2, for tests and benchmarks. The annotations are
+# deterministic but not linguistically meaningful.
+import json
+import os
+import socketserver
+import threading
+
+import regex as re
+
+PATTERN_TOKEN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_END = {".", "?", "!"}
+
+
+def fake_liner2(text: str) -> dict:
+    sentences = [{"tokens": []}]
+    annotations = []
+    names = []
+    end = 0
+    for i, match in enumerate(PATTERN_TOKEN.finditer(text), 1):
+        orth = match.group()
+        token = {
+            "orth": orth,
+            "ns": i > 1 and match.start() == end,
+            "id": f"t{i}",
+            "lexems": [
+                {
+                    "ctag": "ign" if orth[0].isalnum() else "interp",
+                    "disamb": True,
+                    "base": orth.lower(),
+                }
+            ],
+        }
+        end = match.end()
+        previous = sentences[-1]["tokens"]
+        if previous and previous[-1]["orth"] in SENTENCE_END:
+            sentences.append({"tokens": []})
+        sentences[-1]["tokens"].append(token)
+        # runs of capitalised words are annotated as names
+        if orth[0].isupper():
+            names.append(token)
+        else:
+            _append_annotation(annotations, names, "nam")
+            names = []
+    _append_annotation(annotations, names, "nam")
+    return {"chunks": [{"sentences": sentences}], "annotations": annotations}
+
+
+def _append_annotation(annotations: list, tokens: list, type_str: str):
+    if not tokens:
+        return
+    annotations.append(
+        {
+            "tokens": [x["id"] for x in tokens],
+            "id": f"a{len(annotations) + 1}",
+            "text": "".join(
+                x["orth"] if x["ns"] or i == 0 else " " + x["orth"]
+                for i, x in enumerate(tokens)
+            ),
+            "type": type_str,
+        }
+    )
+
+
+class FakeLiner2Daemon(object):
+    # local server speaking the Liner2Daemon protocol
+
+    def __init__(self, annotate=fake_liner2, host="127.0.0.1", port=0):
+        annotate_text = annotate
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        text = json.loads(line.decode("utf8"))["text"]
+                        response = {"liner2": annotate_text(text)}
+                    except Exception as e:
+                        response = {"error": str(e)}
+                    self.wfile.write(
+                        json.dumps(response, ensure_ascii=False).encode("utf8")
+                        + b"\n"
+                    )
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+
+class FakeLiner2Runner(object):
+    # local stand-in for DockerLiner2Runner
+
+    def __init__(self, annotate=fake_liner2):
+        self.annotate = annotate
+
+    def run(self, input_path: str, output_path: str):
+        for entry in os.scandir(input_path):
+            if not entry.is_file():
+                continue
+            with open(entry.path, "r", encoding="utf8") as f:
+                liner2_output = self.annotate(f.read())
+            with open(
+                os.path.join(output_path, entry.name + ".json"), "w", encoding="utf8"
+            ) as f:
+                json.dump(liner2_output, f, ensure_ascii=False)
+
+
+class FakeDockerClient(object):
+    # local stand-in for docker.DockerClient that runs fake_liner2 for
+    # liner2-batch.sh containers, e.g. SemAnalyser(docker_client=...)
+
+    class Image(object):
+        id = "sha256:fake-liner2"
+
+    class Images(object):
+        def get(self, name):
+            return FakeDockerClient.Image()
+
+        def pull(self, repository, *args, **kwargs):
+            return FakeDockerClient.Image()
+
+    class Containers(object):
+        def __init__(self, annotate):
+            self.runner = FakeLiner2Runner(annotate)
+
+        def run(self, image, entrypoint=None, volumes=None, **kwargs):
+            paths = {x["bind"]: host for host, x in (volumes or {}).items()}
+            if "/liner2/input" not in paths or "/liner2/output" not in paths:
+                raise NotImplementedError(f"Fake container {entrypoint}")
+            self.runner.run(paths["/liner2/input"], paths["/liner2/output"])
+            return b""
+
+    def __init__(self, annotate=fake_liner2):
+        self.images = self.Images()
+        self.containers = self.Containers(annotate)
@@ -0,0 +1,97 @@
+# coding: UTF-8
+import abc
+import logging
+import os
+import tarfile
+import zipfile
+from typing import Generator
+
+import regex as re
+
+logger = logging.getLogger(__name__)
+
+
+class InputSource(abc.ABC):
+    # The documents to analyse, as (name, raw bytes) in the order they are
+    # stored: the files of a directory, or the regular files of a .tar (also
+    # compressed, e.g. .tar.gz) or .zip archive, read straight out of it.
+    # Every document is read once. Documents are named by their file name;
+    # archive members whose file name was already seen are skipped.
+    PATTERN_META_CHARSET = re.compile(
+        rb"""(?i)<meta[^>]+charset\s*=\s*["']?([-\w.:]+)"""
+    )
+    # how far into a document a charset declaration is looked for
+    SNIFF_SIZE = 4096
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @staticmethod
+    def open(path: str):
+        if os.path.isdir(path):
+            return DirectorySource(path)
+        if zipfile.is_zipfile(path):
+            return ZipSource(path)
+        if tarfile.is_tarfile(path):
+            return TarSource(path)
+        raise ValueError(f"{path} is not a directory, tar or zip archive")
+
+    @classmethod
+    def decode(cls, content: bytes) -> str:
+        # UTF-8, else the charset the document declares, else ISO-8859-2
+        try:
+            return content.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+        match = cls.PATTERN_META_CHARSET.search(content[: cls.SNIFF_SIZE])
+        if match:
+            try:
+                return content.decode(match[1].decode("ascii"))
+            except (LookupError, UnicodeDecodeError):
+                pass
+        return content.decode("iso-8859-2")
+
+    def __iter__(self) -> Generator[tuple, None, None]:
+        seen = set()
+        for member, read in self._iter_members():
+            name = os.path.basename(member)
+            if name in seen:
+                logger.warning("Skipping %s, %s was already read", member, name)
+                continue
+            seen.add(name)
+            yield name, read()
+
+    @abc.abstractmethod
+    def _iter_members(self) -> Generator[tuple, None, None]:
+        # (name, function reading the member) of every member
+        pass
+
+
+class DirectorySource(InputSource):
+    def _iter_members(self) -> Generator[tuple, None, None]:
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if os.path.isfile(path):
+                yield name, lambda path=path: self._read_file(path)
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+
+class TarSource(InputSource):
+    def _iter_members(self) -> Generator[tuple, None, None]:
+        # read as a stream, so a compressed archive is decompressed once
+        with tarfile.open(self.path, "r|*") as tar:
+            for member in tar:
+                if member.isfile():
+                    yield member.name, tar.extractfile(member).read
+
+
+class ZipSource(InputSource):
+    def _iter_members(self) -> Generator[tuple, None, None]:
+        with zipfile.ZipFile(self.path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, lambda info=info: archive.read(info)
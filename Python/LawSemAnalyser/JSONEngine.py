@@ -0,0 +1,110 @@
+# coding: UTF-8
+import gzip
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class JSONEngine(object):
+    # Reads and writes JSON through orjson or msgspec when installed, and
+    # json otherwise. Every engine writes the bytes of json.dumps(value,
+    # ensure_ascii=False, separators=(",", ":")) encoded as UTF-8 for the
+    # analysis results, which hold no floats. default converts values the
+    # engine cannot write, as in json.dumps.
+    #
+    # Files are written to "<path>.tmp" and renamed, so a reader never sees
+    # half of one, and can be compressed while they are written: "gzip" or,
+    # with zstandard installed, "zstd". They are read back by extension.
+    ENGINES = ["orjson", "msgspec", "json"]
+    COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+    CHUNK_SIZE = 1024 ** 2
+
+    def __init__(self, name=None, default=None):
+        installed = self.installed()
+        if name is None:
+            name = installed[0]
+        elif name not in installed:
+            raise ValueError(f"JSON engine {name} is not installed")
+        self.name = name
+        self.default = default
+        if name == "msgspec":
+            self._encoder = msgspec.json.Encoder(enc_hook=default)
+
+    @classmethod
+    def installed(cls) -> list:
+        modules = {"orjson": orjson, "msgspec": msgspec, "json": json}
+        return [x for x in cls.ENGINES if modules[x]]
+
+    @classmethod
+    def check_compression(cls, compression):
+        if compression is None:
+            return
+        if compression not in cls.COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression {compression}")
+        if compression == "zstd" and not zstandard:
+            raise ValueError("zstd compression needs the zstandard package")
+
+    def dumps(self, value) -> bytes:
+        if self.name == "orjson":
+            return orjson.dumps(value, default=self.default)
+        if self.name == "msgspec":
+            return self._encoder.encode(value)
+        return json.dumps(
+            value, ensure_ascii=False, separators=(",", ":"), default=self.default
+        ).encode("utf8")
+
+    def loads(self, data: bytes):
+        if self.name != "json":
+            try:
+                if self.name == "orjson":
+                    return orjson.loads(data)
+                return msgspec.json.decode(data)
+            except Exception:
+                # e.g. lone surrogates, which only json reads; if json fails
+                # as well, its error is raised
+                pass
+        return json.loads(data)
+
+    def dump(self, value, path: str, compression=None):
+        data = memoryview(self.dumps(value))
+        temp_path = path + ".tmp"
+        with self._open_write(temp_path, compression) as f:
+            for i in range(0, len(data), self.CHUNK_SIZE):
+                f.write(data[i : i + self.CHUNK_SIZE])
+        os.replace(temp_path, path)
+
+    def load(self, path: str):
+        return self.loads(self.read_bytes(path))
+
+    @classmethod
+    def read_bytes(cls, path: str) -> bytes:
+        if path.endswith(cls.COMPRESSION_SUFFIXES["gzip"]):
+            with gzip.open(path, "rb") as f:
+                return f.read()
+        if path.endswith(cls.COMPRESSION_SUFFIXES["zstd"]):
+            with open(path, "rb") as f:
+                with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+                    return reader.read()
+        with open(path, "rb") as f:
+            return f.read()
+
+    @classmethod
+    def _open_write(cls, path: str, compression=None):
+        cls.check_compression(compression)
+        if compression == "gzip":
+            return gzip.open(path, "wb")
+        if compression == "zstd":
+            return zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+        return open(path, "wb")
@@ -0,0 +1,256 @@
+# coding: UTF-8
+import lxml.html
+import regex as re
+from lxml import etree
+
+from .HTMLExtractor import HTMLExtractor
+
+
+def _has_class(class_name: str) -> str:
+    # XPath predicate matching one of the space separated values of @class,
+    # like BeautifulSoup does
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+class LXMLExtractor(HTMLExtractor):
+    # Walks the lxml tree directly instead of going through BeautifulSoup.
+    # Produces exactly the same result as HTMLExtractor, so it shares its
+    # VERSION.
+    PATTERN_PART_ID = re.compile(r"part_[0-9]+")
+
+    XPATH_SECTIONS = etree.XPath(".//section[@id]")
+    XPATH_BLOCK = etree.XPath(f".//div[{_has_class('block')}]")
+    XPATH_PART_HEADER = etree.XPath(f".//h2[{_has_class('part')}]")
+    XPATH_PRO_TEXT = etree.XPath(f".//div[{_has_class('pro-text')}]")
+    XPATH_CHAPTERS = etree.XPath(f"./*[{_has_class('unit_chpt')}]")
+    XPATH_ARTICLES = etree.XPath(f"./*[{_has_class('unit_arti')}]")
+    XPATH_PARAGRAPHS = etree.XPath(f"./*[{_has_class('unit_para')}]")
+    XPATH_GLOSS_SECTION = etree.XPath(f".//div[{_has_class('gloss-section')}]")
+    XPATH_GLOSSES = etree.XPath(f"./div[{_has_class('gloss')}]")
+    XPATH_PART = etree.XPath(f".//div[{_has_class('part')}]")
+
+    class ISAPLawDoc(HTMLExtractor.LawDoc):
+        # content lists hold lxml elements and plain strings, the latter
+        # standing in for BeautifulSoup's NavigableString
+        def __init__(self, soup: etree._Element, extractor, units=None):
+            self.type = "ISAP"
+            self.units = units
+            super().__init__(soup, extractor)
+
+        @classmethod
+        def find_units(cls, extractor, soup: etree._Element) -> list:
+            # see HTMLExtractor.ISAPLawDoc.find_units
+            sections = [
+                x
+                for x in extractor.XPATH_SECTIONS(soup)
+                if extractor.PATTERN_PART_ID.search(x.attrib["id"])
+            ]
+            section = sections[0]
+            block = cls._first(extractor.XPATH_BLOCK(section))
+            units = [
+                (
+                    "head",
+                    [
+                        soup.find(".//h1"),
+                        cls._first(extractor.XPATH_PART_HEADER(section)),
+                        cls._first(extractor.XPATH_PRO_TEXT(block)),
+                    ],
+                )
+            ]
+            for chapter in extractor.XPATH_CHAPTERS(block):
+                units.append(("chapter", [chapter]))
+            for paragraph in extractor.XPATH_PARAGRAPHS(block):
+                units.append(("paragraph", [paragraph]))
+            gloss_section = cls._first(extractor.XPATH_GLOSS_SECTION(section))
+            for gloss in extractor.XPATH_GLOSSES(gloss_section):
+                units.append(("gloss", [gloss]))
+            for appendix in sections[1:]:
+                units.append(("appendix", [cls._first(extractor.XPATH_PART(appendix))]))
+            return units
+
+        def _extract(self):
+            extractor = self.extractor
+            soup = self.soup.find(".//body")
+            if self.units is None:
+                units = self.find_units(extractor, soup)
+            else:
+                nodes = soup.iterchildren("*")
+                units = [
+                    (kind, [next(nodes) for _ in range(count)])
+                    for kind, count in self.units
+                ]
+            for kind, nodes in units:
+                elements = getattr(self, f"_extract_{kind}")(*nodes)
+                for element in elements:
+                    self._extract_links(element)
+                    element["content"] = " ".join(
+                        [
+                            x
+                            for x in [
+                                extractor._clean_html(y) for y in element["content"]
+                            ]
+                            if x
+                        ]
+                    )
+
+            document = self.result["document"]
+            self.html_result["document"]["body"] = document["body"].copy()
+            self.html_result["document"]["glossary"] = document["glossary"].copy()
+
+        def _extract_head(self, h1, part_header, pro_text) -> list:
+            title = []
+            subtitle = []
+            for child in h1.iterchildren("*"):
+                contents = self._contents(child)
+                title.append(contents[0])
+                if len(contents) > 1:
+                    subtitle.append(contents[1])
+            elements = [
+                self._create_element("title", "0", title),
+                self._create_element("subtitle", "0", subtitle),
+                self._create_element("introduction", "0", [part_header, pro_text]),
+            ]
+            self.result["document"]["body"].extend(elements)
+            return elements
+
+        def _extract_chapter(self, chapter) -> list:
+            header = chapter.findall("p")
+            elements = [
+                self._create_element("chapter", chapter.attrib["data-id"], header)
+            ]
+            div_inner = chapter.find(".//div")
+            for article in self.extractor.XPATH_ARTICLES(div_inner):
+                elements.append(
+                    self._create_element(
+                        "article", article.attrib["data-id"], [article]
+                    )
+                )
+            self.result["document"]["body"].extend(elements)
+            return elements
+
+        def _extract_paragraph(self, paragraph) -> list:
+            elements = [
+                self._create_element(
+                    "paragraph", paragraph.attrib["data-id"], [paragraph]
+                )
+            ]
+            self.result["document"]["body"].extend(elements)
+            return elements
+
+        def _extract_gloss(self, gloss) -> list:
+            elements = [
+                self._create_element("gloss", gloss.attrib["id"], self._contents(gloss))
+            ]
+            self.result["document"]["glossary"].extend(elements)
+            return elements
+
+        def _extract_appendix(self, appendix) -> list:
+            elements = [
+                self._create_element("appendix", appendix.attrib["id"], [appendix])
+            ]
+            self.result["document"]["body"].extend(elements)
+            return elements
+
+        def _extract_links(self, element: dict):
+            for child in element["content"]:
+                if isinstance(child, str):
+                    continue
+                links = list(child.iterdescendants("a"))
+                if child.tag == "a":
+                    links.append(child)
+                for link in links:
+                    href = link.get("href")
+                    if href is None:
+                        continue
+                    is_external = True
+                    if href[0] == "#":
+                        is_external = False
+                        address = href[1:]
+                    else:
+                        address = href
+                    element["links"].append(
+                        self._create_link(
+                            self.extractor._clean_html(link), address, is_external
+                        )
+                    )
+
+        def _create_link(self, text: str, address: str, is_external: bool) -> dict:
+            if is_external and address.startswith("/api"):
+                address = address.replace("/api", "http://isap.sejm.gov.pl/api", 1)
+            return {
+                "text": text,
+                "address": address,
+                "is_external": is_external,
+            }
+
+        @staticmethod
+        def _first(elements: list):
+            return elements[0] if elements else None
+
+        @staticmethod
+        def _contents(element: etree._Element) -> list:
+            # the child nodes of element in BeautifulSoup's terms: text, child
+            # elements and their tails, with comments as plain strings
+            contents = []
+            if element.text:
+                contents.append(element.text)
+            for child in element:
+                if isinstance(child.tag, str):
+                    contents.append(child)
+                elif child.tag is etree.Comment and child.text:
+                    contents.append(child.text)
+                if child.tail:
+                    contents.append(child.tail)
+            return contents
+
+    def read_html(self, input_file) -> etree._Element:
+        return lxml.html.document_fromstring(input_file.read())
+
+    def release_html(self, soup: etree._Element):
+        return
+
+    def extract_html_part(self, soup: etree._Element, units: list):
+        return self.ISAPLawDoc(soup, self, units)
+
+    def _get_law_doc(self, soup: etree._Element) -> HTMLExtractor.LawDoc:
+        return self.ISAPLawDoc(soup, self)
+
+    def _clean_html(self, html_string) -> str:
+        if isinstance(html_string, str):
+            return super()._clean_html(html_string)
+        if next(html_string.iter(etree.Comment, "script", "style"), None) is not None:
+            # PATTERN_CLEAN_HMTL only partly strips some comments, so these
+            # go through the same markup BeautifulSoup would produce
+            return super()._clean_html(self._markup(html_string))
+        # BeautifulSoup serialises text escaped and the tags it strips again
+        # are left out here altogether
+        return self._replace_bad_chars(
+            self._collapse_whitespace(self._escape("".join(html_string.itertext())))
+        ).strip()
+
+    @staticmethod
+    def _escape(text: str) -> str:
+        if "&" in text or "<" in text or ">" in text:
+            text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        return text
+
+    def _markup(self, element: etree._Element) -> str:
+        # tags become bare "<>", which PATTERN_CLEAN_HMTL strips just the same
+        parts = []
+        self._append_markup(element, parts)
+        return "".join(parts)
+
+    def _append_markup(self, element: etree._Element, parts: list):
+        # script and style contents are not escaped by BeautifulSoup
+        escape = str if element.tag in ("script", "style") else self._escape
+        parts.append("<>")
+        if element.text:
+            parts.append(escape(element.text))
+        for child in element:
+            if isinstance(child.tag, str):
+                self._append_markup(child, parts)
+            elif child.tag is etree.Comment:
+                parts.append(f"<!--{child.text or ''}-->")
+            if child.tail:
+                parts.append(escape(child.tail))
+        parts.append("<>")
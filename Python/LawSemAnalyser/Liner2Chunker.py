@@ -0,0 +1,107 @@
+# coding: UTF-8
+class Liner2Chunker(object):
+    # Packs many element texts into size-bounded chunks, one Liner2 input each,
+    # and splits the Liner2 output of a chunk back into per-element outputs.
+    # Elements are separated by a paragraph holding only MARKER, which Liner2
+    # keeps as a single token. Texts have to be stripped and not empty - an
+    # empty text has no tokens to tell it apart.
+    MARKER = "lsaelementboundary"
+    SEPARATOR = f"\n\n{MARKER}\n\n"
+    CHUNK_PREFIX = "liner2_chunk"
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+
+    def pack(self, texts: dict) -> dict:
+        # texts maps element names to their text. Returns a dict mapping chunk
+        # names to (chunk text, [[element name, offset, length], ...]).
+        chunks = {}
+        parts = []
+        offsets = []
+        size = 0
+        for name, text in texts.items():
+            if parts and size + len(self.SEPARATOR) + len(text) > self.max_size:
+                self._add_chunk(chunks, parts, offsets)
+                parts = []
+                offsets = []
+                size = 0
+            if parts:
+                size += len(self.SEPARATOR)
+            offsets.append([name, size, len(text)])
+            parts.append(text)
+            size += len(text)
+        if parts:
+            self._add_chunk(chunks, parts, offsets)
+        return chunks
+
+    def split(self, liner2_output: dict, texts: dict) -> dict:
+        # texts maps the element names of the chunk to their text, in order.
+        # Token and annotation ids are renumbered from t1 and a1 for every
+        # element, as if each had been annotated on its own. Raises
+        # ValueError when the tokens of an element do not spell out the
+        # non-space characters of its text, e.g. when Liner2 did not keep
+        # MARKER as a token of its own.
+        names = list(texts)
+        outputs = [{"chunks": [], "annotations": []} for _ in names]
+        token_counts = [0] * len(names)
+        # chunk token id -> (element index, element token id)
+        token_map = {}
+        current = 0
+        for chunk in liner2_output["chunks"]:
+            target_chunk = None
+            for sentence in chunk["sentences"]:
+                target_sentence = None
+                for token in sentence["tokens"]:
+                    if token["orth"] == self.MARKER:
+                        current += 1
+                        target_chunk = None
+                        target_sentence = None
+                        continue
+                    if current >= len(names):
+                        raise ValueError(
+                            f"Liner2 output has more than {len(names)} elements"
+                        )
+                    if target_chunk is None:
+                        target_chunk = {"sentences": []}
+                        outputs[current]["chunks"].append(target_chunk)
+                    if target_sentence is None:
+                        target_sentence = {"tokens": []}
+                        target_chunk["sentences"].append(target_sentence)
+                    token_counts[current] += 1
+                    token_id = f"t{token_counts[current]}"
+                    token_map[token["id"]] = (current, token_id)
+                    target_sentence["tokens"].append(dict(token, id=token_id))
+        if current != len(names) - 1:
+            raise ValueError(
+                f"Liner2 output has {current + 1} elements, expected {len(names)}"
+            )
+
+        for annotation in liner2_output["annotations"]:
+            tokens = [token_map[x] for x in annotation["tokens"] if x in token_map]
+            if not tokens:
+                continue
+            # an annotation reaching over a boundary stays with the element
+            # of its first token
+            element = tokens[0][0]
+            outputs[element]["annotations"].append(
+                dict(annotation, tokens=[x[1] for x in tokens if x[0] == element])
+            )
+        for name, output in zip(names, outputs):
+            orth_length = sum(
+                len(token["orth"])
+                for chunk in output["chunks"]
+                for sentence in chunk["sentences"]
+                for token in sentence["tokens"]
+            )
+            if orth_length != len("".join(texts[name].split())):
+                raise ValueError(f"Liner2 tokens of {name} do not match its text")
+            output["annotations"].sort(key=lambda x: int(x["tokens"][0][1:]))
+            for i, annotation in enumerate(output["annotations"]):
+                annotation["id"] = f"a{i+1}"
+        return dict(zip(names, outputs))
+
+    def _add_chunk(self, chunks: dict, parts: list, offsets: list):
+        chunks[f"{self.CHUNK_PREFIX}.{len(chunks):06d}"] = (
+            self.SEPARATOR.join(parts),
+            offsets,
+        )
@@ -0,0 +1,165 @@
+# coding: UTF-8
+import json
+import logging
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class Liner2Daemon(object):
+    # Requests and responses are single lines of UTF-8 JSON:
+    #   -> {"text": "..."}
+    #   <- {"liner2": {"chunks": [...], "annotations": [...]}} or {"error": "..."}
+    # served in the image by liner2-jsonl-server.py (see Liner2_Dockerfile)
+    ENTRYPOINT = "/liner2/liner2-jsonl-server.py"
+
+    def __init__(
+        self,
+        docker_client=None,
+        docker_image="yard1/liner2-cli:latest",
+        address=None,
+        port=9999,
+        connections=4,
+        startup_timeout=600.0,
+    ):
+        self.docker_client = docker_client
+        self.docker_image = docker_image
+        self.address = address
+        self.port = port
+        self.connections = connections
+        self.startup_timeout = startup_timeout
+        self.container = None
+        self._pool = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def start(self):
+        if self._executor:
+            return self
+        if not self.address:
+            self._start_container()
+        self._wait_until_ready()
+        self._executor = ThreadPoolExecutor(max_workers=self.connections)
+        return self
+
+    def stop(self):
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+        while not self._pool.empty():
+            self._close(self._pool.get_nowait())
+        if self.container:
+            self.container.stop()
+            self.container = None
+            self.address = None
+
+    def annotate(self, text: str) -> dict:
+        connection = self._acquire()
+        try:
+            response = self._request(connection, text)
+        except Exception:
+            self._close(connection)
+            raise
+        self._pool.put(connection)
+        if "error" in response:
+            raise RuntimeError(f"Liner2 daemon error: {response['error']}")
+        return response["liner2"]
+
+    def annotate_many(self, texts) -> Iterator[dict]:
+        # the outputs in order, each as soon as it and those before it are in;
+        # None for a text the daemon answered with an error
+        self.start()
+        return self._executor.map(self._annotate_or_none, texts)
+
+    def _annotate_or_none(self, text: str) -> dict:
+        try:
+            return self.annotate(text)
+        except RuntimeError as e:
+            logger.warning("%s, text skipped: %.80r", e, text)
+            return None
+
+    def _start_container(self):
+        logger.info("Starting Liner2 daemon %s...", self.docker_image)
+        self.container = self.docker_client.containers.run(
+            self.docker_image,
+            entrypoint=self.ENTRYPOINT,
+            detach=True,
+            auto_remove=True,
+            ports={f"{self.port}/tcp": ("127.0.0.1", None)},
+        )
+        self.container.reload()
+        host_port = self.container.attrs["NetworkSettings"]["Ports"][
+            f"{self.port}/tcp"
+        ][0]["HostPort"]
+        self.address = ("127.0.0.1", int(host_port))
+
+    def _wait_until_ready(self):
+        # the models take a while to load, and a published port accepts
+        # connections before the daemon listens, so wait for a full round trip
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            connection = None
+            try:
+                connection = self._connect()
+                self._request(connection, "")
+                with self._lock:
+                    self._opened += 1
+                self._pool.put(connection)
+                return
+            except OSError:
+                if connection:
+                    self._disconnect(connection)
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(
+                        f"Liner2 daemon at {self.address} did not start in time"
+                    )
+                time.sleep(1)
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_open = self._opened < self.connections
+            if can_open:
+                self._opened += 1
+        if not can_open:
+            return self._pool.get()
+        try:
+            return self._connect()
+        except OSError:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def _connect(self):
+        sock = socket.create_connection(self.address)
+        return sock, sock.makefile("rb")
+
+    def _disconnect(self, connection):
+        sock, reader = connection
+        reader.close()
+        sock.close()
+
+    def _close(self, connection):
+        self._disconnect(connection)
+        with self._lock:
+            self._opened -= 1
+
+    def _request(self, connection, text: str) -> dict:
+        sock, reader = connection
+        sock.sendall(
+            json.dumps({"text": text}, ensure_ascii=False).encode("utf8") + b"\n"
+        )
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Liner2 daemon closed the connection")
+        return json.loads(line.decode("utf8"))
@@ -0,0 +1,94 @@
+# coding: UTF-8
+from array import array
+from collections.abc import Mapping
+
+from .ColumnarOutput import ColumnarOutput
+
+
+class Liner2Output(Mapping):
+    # The Liner2 output of an element kept in memory as ColumnarOutput columns
+    # instead of a dict per token and lexem. Token and lexem columns are
+    # arrays of indices into the element's own strings, which are packed into
+    # one str and go away with the element, so nothing outlives it. It reads
+    # like the usual dict, decoding "chunks" or "annotations" when asked for,
+    # and json.dump writes exactly the same output with
+    # default=Liner2Output.json_default.
+    #
+    # Output that does not round-trip through the columns is not compacted.
+    __slots__ = ("columns",)
+    KEYS = ("chunks", "annotations")
+
+    def __init__(self, columns: dict):
+        self.columns = columns
+
+    @classmethod
+    def compact(cls, liner2_output):
+        if liner2_output is None or isinstance(liner2_output, cls):
+            return liner2_output
+        strings = {}
+        columns = ColumnarOutput.encode_liner2(liner2_output, strings)
+        if "raw" in columns:
+            return liner2_output
+        for key in ("orth", "ctag", "base"):
+            columns[key] = array("I", columns[key])
+        columns["annotations"] = tuple(
+            tuple(tuple(x) if isinstance(x, list) else x for x in annotation)
+            for annotation in columns["annotations"]
+        )
+        if "lexems" in columns:
+            columns["lexems"] = array("I", columns["lexems"])
+        columns["sentences"] = tuple(tuple(x) for x in columns["sentences"])
+        columns["strings"] = cls._pack_strings(strings)
+        return cls(columns)
+
+    @classmethod
+    def expand(cls, value):
+        # a plain dict, for code that changes or stores the output
+        if isinstance(value, cls):
+            return value.to_dict()
+        return value
+
+    @classmethod
+    def json_default(cls, value):
+        if isinstance(value, cls):
+            return value.to_dict()
+        raise TypeError(
+            f"Object of type {type(value).__name__} is not JSON serializable"
+        )
+
+    def to_dict(self) -> dict:
+        return ColumnarOutput.decode_liner2(self.columns, self._strings())
+
+    def __getitem__(self, key: str) -> list:
+        if key == "chunks":
+            return ColumnarOutput.decode_chunks(self.columns, self._strings())
+        if key == "annotations":
+            return ColumnarOutput.decode_annotations(self.columns, self._strings())
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.KEYS
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def _strings(self) -> list:
+        text, offsets = self.columns["strings"]
+        return [text[offsets[i] : offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    @staticmethod
+    def _pack_strings(strings) -> tuple:
+        # one str and where each string starts in it, not a str object each
+        offsets = array("I", [0])
+        for x in strings:
+            offsets.append(offsets[-1] + len(x))
+        return "".join(strings), offsets
+
+    def __reduce__(self):
+        return (type(self), (self.columns,))
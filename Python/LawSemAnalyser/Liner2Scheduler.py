@@ -0,0 +1,138 @@
+# coding: UTF-8
+import heapq
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class DockerLiner2Runner(object):
+    # runs liner2-batch.sh over every file of input_path once
+    ENTRYPOINT = "/liner2/liner2-batch.sh"
+
+    def __init__(self, docker_client, docker_image="yard1/liner2-cli:latest"):
+        self.docker_client = docker_client
+        self.docker_image = docker_image
+
+    def run(self, input_path: str, output_path: str):
+        self.docker_client.containers.run(
+            self.docker_image,
+            entrypoint=self.ENTRYPOINT,
+            userns_mode="host",
+            volumes={
+                os.path.abspath(input_path): {
+                    "bind": "/liner2/input",
+                    "mode": "rw",
+                },
+                os.path.abspath(output_path): {
+                    "bind": "/liner2/output",
+                    "mode": "rw",
+                },
+                tempfile.gettempdir(): {"bind": "/tmp", "mode": "rw"},
+            },
+        )
+
+
+class Liner2Scheduler(object):
+    # Splits the Liner2 inputs into shards of about the same total size and
+    # runs one container per shard, at most concurrency at a time. Shards go
+    # round robin over the runners - one per Docker endpoint - and a failed
+    # shard is retried on its own, on the next runner. Every runner has to see
+    # the input and output paths, e.g. on a shared file system.
+    SHARD_PREFIX = "shard_"
+    RETRY_PREFIX = "retry_"
+    OUTPUT_SUFFIX = ".json"
+
+    def __init__(self, runners: list, shards=1, concurrency=None, retries=2):
+        self.runners = runners
+        self.shards = shards
+        self.concurrency = concurrency if concurrency else shards
+        self.retries = retries
+
+    def run(self, input_path: str, output_path: str):
+        names = sorted(os.listdir(input_path))
+        if self.shards <= 1 or len(names) <= 1:
+            self._run_shard(0, input_path, output_path)
+            return
+        shard_paths = self._split(input_path, names)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [
+                executor.submit(self._run_shard, i, x, output_path)
+                for i, x in enumerate(shard_paths)
+            ]
+            for future in futures:
+                future.result()
+
+    @staticmethod
+    def balance(sizes: dict, shards: int) -> list:
+        # the largest inputs first, each to the shard with the least text
+        heap = [(0, i, []) for i in range(min(shards, len(sizes)))]
+        for name in sorted(sizes, key=lambda x: (-sizes[x], x)):
+            size, i, names = heapq.heappop(heap)
+            names.append(name)
+            heapq.heappush(heap, (size + sizes[name], i, names))
+        return [x[2] for x in sorted(heap, key=lambda x: x[1])]
+
+    def _split(self, input_path: str, names: list) -> list:
+        sizes = {x: os.path.getsize(os.path.join(input_path, x)) for x in names}
+        shard_paths = []
+        for i, shard in enumerate(self.balance(sizes, self.shards)):
+            shard_path = os.path.join(input_path, f"{self.SHARD_PREFIX}{i:03d}")
+            os.makedirs(shard_path)
+            for name in shard:
+                os.replace(
+                    os.path.join(input_path, name), os.path.join(shard_path, name)
+                )
+            logger.info(
+                "Shard %d: %d files, %d bytes",
+                i,
+                len(shard),
+                sum(sizes[x] for x in shard),
+            )
+            shard_paths.append(shard_path)
+        return shard_paths
+
+    def _run_shard(self, index: int, input_path: str, output_path: str):
+        for attempt in range(self.retries + 1):
+            runner = self.runners[(index + attempt) % len(self.runners)]
+            logger.info(
+                "Running Liner2 on shard %d (attempt %d)...", index, attempt + 1
+            )
+            try:
+                runner.run(input_path, output_path)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning("Liner2 failed on shard %d: %r", index, e)
+                continue
+            missing = self._missing_outputs(input_path, output_path)
+            if not missing:
+                logger.info("Done running Liner2 on shard %d", index)
+                return
+            logger.warning(
+                "Liner2 left %d files of shard %d without output", len(missing), index
+            )
+            if attempt == self.retries:
+                # like a single container run, leave their elements without
+                # Liner2 output in the end
+                return
+            # only the files without output go again
+            retry_path = os.path.join(input_path, f"{self.RETRY_PREFIX}{attempt + 1}")
+            os.makedirs(retry_path)
+            for name in missing:
+                os.replace(
+                    os.path.join(input_path, name), os.path.join(retry_path, name)
+                )
+            input_path = retry_path
+
+    def _missing_outputs(self, input_path: str, output_path: str) -> list:
+        return [
+            x.name
+            for x in sorted(os.scandir(input_path), key=lambda x: x.name)
+            if x.is_file()
+            and not os.path.exists(
+                os.path.join(output_path, x.name + self.OUTPUT_SUFFIX)
+            )
+        ]
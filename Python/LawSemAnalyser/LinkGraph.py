@@ -0,0 +1,165 @@
+# coding: UTF-8
+import json
+import os
+from array import array
+from urllib.parse import urlsplit
+
+import regex as re
+
+
+class LinkGraph(object):
+    # Graph of the links between elements of extracted documents. A node is
+    # (document, element type, element id), or (document, None, None) for a
+    # document as a whole. Internal "#id" links point to the element with that
+    # id and ISAP addresses to the document with that publication address
+    # (e.g. WDU/2017/819 for ust_wdu_2017_819.html), or to its element named
+    # by the address fragment. Documents outside the graph are nodes of their
+    # own, keyed by publication address (or by the address itself), and are
+    # resolved once they are added.
+    #
+    # Documents are added as they are extracted. The edges are kept as CSR
+    # arrays - the targets of node i are targets[offsets[i]:offsets[i + 1]] -
+    # forward and reverse, rebuilt on the first lookup after a change.
+    VERSION = 1
+    PATTERN_DOCUMENT_NAME = re.compile(r"(?i)(wdu|wmp)_([0-9]+)_([0-9]+)")
+    PATTERN_ISAP_ADDRESS = re.compile(r"(?i)/deeds/(wdu|wmp)/([0-9]+)/([0-9]+)/")
+
+    def __init__(self, path=None):
+        self.path = path
+        self.documents = {}
+        self.nodes = []
+        self.forward = (array("I", [0]), array("I"))
+        self.reverse = (array("I", [0]), array("I"))
+        self._node_ids = {}
+        self._dirty = False
+        if path and os.path.exists(path):
+            self._load()
+
+    @classmethod
+    def document_key(cls, name: str):
+        match = cls.PATTERN_DOCUMENT_NAME.search(name)
+        if not match:
+            return None
+        return f"{match[1].upper()}/{match[2]}/{match[3]}"
+
+    @classmethod
+    def address_key(cls, address: str) -> tuple:
+        # (document key or the address itself, element id or None)
+        parts = urlsplit(address)
+        match = cls.PATTERN_ISAP_ADDRESS.search(parts.path)
+        if not match:
+            return address, None
+        return f"{match[1].upper()}/{match[2]}/{match[3]}", parts.fragment or None
+
+    def add_document(self, name: str, result: dict):
+        # replaces whatever an earlier extraction of the document added
+        elements = result["document"]["body"] + result["document"]["glossary"]
+        links = []
+        for i, element in enumerate(elements):
+            for link in element["links"]:
+                if link["is_external"]:
+                    links.append([i] + list(self.address_key(link["address"])))
+                else:
+                    links.append([i, None, link["address"]])
+        self.documents[name] = {
+            "elements": [[x["type"], x["id"]] for x in elements],
+            "links": links,
+        }
+        self._dirty = True
+
+    def remove_document(self, name: str):
+        if self.documents.pop(name, None) is not None:
+            self._dirty = True
+
+    def links_from(self, document: str, type_str=None, id_str=None) -> list:
+        return self._neighbours("forward", (document, type_str, id_str))
+
+    def links_to(self, document: str, type_str=None, id_str=None) -> list:
+        return self._neighbours("reverse", (document, type_str, id_str))
+
+    def save(self, path=None):
+        path = path or self.path
+        self._build()
+        data = {
+            "version": self.VERSION,
+            "documents": self.documents,
+            "nodes": self.nodes,
+            "forward": [x.tolist() for x in self.forward],
+            "reverse": [x.tolist() for x in self.reverse],
+        }
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temp_path, path)
+
+    def _neighbours(self, direction: str, node: tuple) -> list:
+        # direction is "forward" or "reverse", read after the arrays are rebuilt
+        self._build()
+        node_id = self._node_ids.get(node)
+        if node_id is None:
+            return []
+        offsets, targets = getattr(self, direction)
+        return [self.nodes[x] for x in targets[offsets[node_id] : offsets[node_id + 1]]]
+
+    def _build(self):
+        if not self._dirty:
+            return
+        nodes = []
+        node_ids = {}
+        keys = {}
+        element_ids = {}
+        for name in sorted(self.documents):
+            node_ids[(name, None, None)] = len(nodes)
+            nodes.append((name, None, None))
+            keys.setdefault(self.document_key(name), name)
+            for type_str, id_str in self.documents[name]["elements"]:
+                node_ids[(name, type_str, id_str)] = len(nodes)
+                element_ids.setdefault((name, id_str), len(nodes))
+                nodes.append((name, type_str, id_str))
+
+        edges = set()
+        for name in sorted(self.documents):
+            document = self.documents[name]
+            element_node_ids = [
+                node_ids[(name, x[0], x[1])] for x in document["elements"]
+            ]
+            for element, target, anchor in document["links"]:
+                target_name = name if target is None else keys.get(target)
+                if target_name is None:
+                    # a document outside the graph
+                    target_id = node_ids.get((target, None, None))
+                    if target_id is None:
+                        target_id = node_ids[(target, None, None)] = len(nodes)
+                        nodes.append((target, None, None))
+                else:
+                    target_id = element_ids.get(
+                        (target_name, anchor), node_ids[(target_name, None, None)]
+                    )
+                edges.add((element_node_ids[element], target_id))
+
+        self.nodes = nodes
+        self._node_ids = node_ids
+        self.forward = self._csr(len(nodes), sorted(edges))
+        self.reverse = self._csr(len(nodes), sorted((y, x) for x, y in edges))
+        self._dirty = False
+
+    @staticmethod
+    def _csr(node_count: int, edges: list) -> tuple:
+        # edges sorted by source
+        offsets = array("I", [0]) * (node_count + 1)
+        for source, _ in edges:
+            offsets[source + 1] += 1
+        for i in range(node_count):
+            offsets[i + 1] += offsets[i]
+        return offsets, array("I", [x[1] for x in edges])
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf8") as f:
+            data = json.load(f)
+        if data.get("version") != self.VERSION:
+            return
+        self.documents = data["documents"]
+        self.nodes = [tuple(x) for x in data["nodes"]]
+        self._node_ids = {x: i for i, x in enumerate(self.nodes)}
+        self.forward = tuple(array("I", x) for x in data["forward"])
+        self.reverse = tuple(array("I", x) for x in data["reverse"])
@@ -0,0 +1,229 @@
+# coding: UTF-8
+import json
+import mmap
+import os
+
+import regex as re
+
+from .ColumnarOutput import ColumnarOutput
+from .Liner2Output import Liner2Output
+
+
+class OutputReader(object):
+    # Reads single elements of an analysis output without loading the whole
+    # file. The output is memory-mapped and located through a sidecar index
+    # ("<output>.idx") of the byte range of every element, written together
+    # with the output (SemAnalyser(output_index=True)) or built here on first
+    # use. Both output formats can be read.
+    INDEX_SUFFIX = ".idx"
+    INDEX_VERSION = 1
+    PATTERN_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = self._load_index()
+        self.type = self.index["type"]
+        # the first element of a repeated (type, id) pair is the one returned
+        self._positions = {}
+        for i, (_, type_str, id_str, _, _) in enumerate(self.index["elements"]):
+            self._positions.setdefault((type_str, id_str), i)
+        self._strings = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.index["elements"])
+
+    def __iter__(self):
+        return self.iter_elements()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def keys(self) -> list:
+        # (part, type, id) of every element, in document order
+        return [tuple(x[:3]) for x in self.index["elements"]]
+
+    def get(self, type_str: str, id_str: str) -> dict:
+        return self._read_element(self._positions[(type_str, id_str)])
+
+    def iter_elements(self, part=None):
+        for i, entry in enumerate(self.index["elements"]):
+            if part is None or entry[0] == part:
+                yield self._read_element(i)
+
+    @classmethod
+    def dump(cls, data: dict, output_file) -> dict:
+        # writes data to a binary file exactly as json.dump(data,
+        # ensure_ascii=False, separators=(",", ":")) would and returns its index
+        index = {
+            "version": cls.INDEX_VERSION,
+            "type": data.get("type"),
+            "format": data.get("format"),
+            "strings": None,
+            "elements": [],
+        }
+        position = 0
+
+        def write(text: str):
+            nonlocal position
+            encoded = text.encode("utf8")
+            output_file.write(encoded)
+            position += len(encoded)
+
+        for i, (key, value) in enumerate(data.items()):
+            write(("," if i else "{") + cls._dumps(key) + ":")
+            if key != "document":
+                start = position
+                write(cls._dumps(value))
+                if key == "strings":
+                    index["strings"] = [start, position - start]
+                continue
+            write("{")
+            for j, (part, elements) in enumerate(value.items()):
+                write(("," if j else "") + cls._dumps(part) + ":[")
+                for k, element in enumerate(elements):
+                    if k:
+                        write(",")
+                    start = position
+                    write(cls._dumps(element))
+                    index["elements"].append(
+                        [part, element["type"], element["id"], start, position - start]
+                    )
+                write("]")
+            write("}")
+        write("}" if data else "{}")
+        index["size"] = position
+        return index
+
+    @classmethod
+    def save_index(cls, path: str, index: dict):
+        temp_path = path + cls.INDEX_SUFFIX + ".tmp"
+        with open(temp_path, "w", encoding="utf8") as f:
+            json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temp_path, path + cls.INDEX_SUFFIX)
+
+    @classmethod
+    def build_index(cls, path: str) -> dict:
+        # one full pass over an output written without an index
+        with open(path, "rb") as f:
+            text = f.read().decode("utf8")
+        decoder = json.JSONDecoder()
+        index = {
+            "version": cls.INDEX_VERSION,
+            "type": None,
+            "format": None,
+            "strings": None,
+            "elements": [],
+        }
+        # character positions are turned into byte positions as they come
+        char_position = 0
+        byte_position = 0
+
+        def to_bytes(position: int) -> int:
+            nonlocal char_position, byte_position
+            byte_position += len(text[char_position:position].encode("utf8"))
+            char_position = position
+            return byte_position
+
+        def skip(position: int, expected="") -> int:
+            position = cls.PATTERN_WHITESPACE.match(text, position).end()
+            if expected:
+                if not text.startswith(expected, position):
+                    raise ValueError(f"Expected {expected!r} at {position} in {path}")
+                position = cls.PATTERN_WHITESPACE.match(
+                    text, position + len(expected)
+                ).end()
+            return position
+
+        position = skip(0, "{")
+        while not text.startswith("}", position):
+            key, position = decoder.raw_decode(text, position)
+            position = skip(position, ":")
+            if key != "document":
+                start = position
+                value, position = decoder.raw_decode(text, position)
+                if key in ("type", "format"):
+                    index[key] = value
+                elif key == "strings":
+                    start_byte = to_bytes(start)
+                    index["strings"] = [start_byte, to_bytes(position) - start_byte]
+                position = skip(position)
+                if text.startswith(",", position):
+                    position = skip(position, ",")
+                continue
+            position = skip(position, "{")
+            while not text.startswith("}", position):
+                part, position = decoder.raw_decode(text, position)
+                position = skip(position, ":")
+                position = skip(position, "[")
+                while not text.startswith("]", position):
+                    start = position
+                    element, position = decoder.raw_decode(text, position)
+                    start_byte = to_bytes(start)
+                    index["elements"].append(
+                        [
+                            part,
+                            element["type"],
+                            element["id"],
+                            start_byte,
+                            to_bytes(position) - start_byte,
+                        ]
+                    )
+                    position = skip(position)
+                    if text.startswith(",", position):
+                        position = skip(position, ",")
+                position = skip(position, "]")
+                if text.startswith(",", position):
+                    position = skip(position, ",")
+            position = skip(position, "}")
+            if text.startswith(",", position):
+                position = skip(position, ",")
+        index["size"] = len(text.encode("utf8"))
+        return index
+
+    def _load_index(self) -> dict:
+        index_path = self.path + self.INDEX_SUFFIX
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf8") as f:
+                index = json.load(f)
+            if index.get("version") == self.INDEX_VERSION and index.get("size") == len(
+                self._map
+            ):
+                return index
+        # missing or stale - the output was rewritten since
+        index = self.build_index(self.path)
+        try:
+            self.save_index(self.path, index)
+        except OSError:
+            pass
+        return index
+
+    def _read_element(self, position: int) -> dict:
+        _, _, _, start, length = self.index["elements"][position]
+        element = json.loads(self._map[start : start + length].decode("utf8"))
+        if self.index["format"] == ColumnarOutput.FORMAT:
+            element = ColumnarOutput.decode_element(element, self._load_strings())
+        return element
+
+    def _load_strings(self) -> list:
+        if self._strings is None:
+            start, length = self.index["strings"]
+            self._strings = json.loads(self._map[start : start + length].decode("utf8"))
+        return self._strings
+
+    @staticmethod
+    def _dumps(value) -> str:
+        return json.dumps(
+            value,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            default=Liner2Output.json_default,
+        )
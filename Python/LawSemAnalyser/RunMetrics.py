@@ -0,0 +1,110 @@
+# coding: UTF-8
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class RunMetrics(object):
+    # Wall and CPU time and counters (bytes_in, bytes_out, elements, tokens,
+    # ...) of the stages of an analysis run, summed per stage and per
+    # document. Every finished stage is also passed to callback as a dict
+    # {"stage", "document", "wall", "cpu", <counters>}. CPU time is that of
+    # the thread running the stage, Liner2 itself runs in Docker.
+    #
+    # Stages named in profile_stages run under cProfile, their stats summed
+    # over all calls and written out with the report.
+    def __init__(self, callback=None, profile_stages=None):
+        self.callback = callback
+        self.profile_stages = set(profile_stages or [])
+        self.stages = {}
+        self.documents = {}
+        self.profiles = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name: str, document=None, **counters):
+        # counters can still be added to the yielded dict while the stage runs
+        profile = self._start_profile(name)
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield counters
+        finally:
+            cpu = time.thread_time() - cpu
+            wall = time.perf_counter() - wall
+            if profile:
+                profile.disable()
+            self.record(name, document, wall=wall, cpu=cpu, **counters)
+
+    def record(self, stage: str, document=None, **values):
+        with self._lock:
+            self._add(self.stages, stage, values)
+            if document is not None:
+                self._add(self.documents.setdefault(document, {}), stage, values)
+        if self.callback:
+            self.callback(dict(values, stage=stage, document=document))
+
+    def report(self) -> dict:
+        with self._lock:
+            stages = {k: dict(v) for k, v in self.stages.items()}
+            documents = {
+                k: {x: dict(y) for x, y in v.items()} for k, v in self.documents.items()
+            }
+        report = {
+            "started": self.started,
+            "wall": time.time() - self.started,
+            "stages": stages,
+            "documents": documents,
+        }
+        liner2_wall = stages.get("liner2", {}).get("wall")
+        tokens = sum(x.get("tokens", 0) for x in stages.values())
+        if liner2_wall:
+            report["liner2_tokens_per_second"] = tokens / liner2_wall
+        if resource:
+            # kilobytes on Linux; the children are the extraction workers
+            report["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            report["peak_rss_children"] = resource.getrusage(
+                resource.RUSAGE_CHILDREN
+            ).ru_maxrss
+        return report
+
+    def save_report(self, path: str):
+        # the profiles go next to the report, as "<report>.<stage>.prof"
+        report = self.report()
+        report["profiles"] = {}
+        for stage, profile in self.profiles.items():
+            profile_path = f"{os.path.splitext(path)[0]}.{stage}.prof"
+            profile.dump_stats(profile_path)
+            report["profiles"][stage] = profile_path
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, path)
+
+    def _start_profile(self, name: str):
+        if name not in self.profile_stages:
+            return None
+        with self._lock:
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is running in this thread
+            return None
+        return profile
+
+    @staticmethod
+    def _add(totals: dict, stage: str, values: dict):
+        stage_totals = totals.setdefault(stage, {"calls": 0})
+        stage_totals["calls"] += 1
+        for key, value in values.items():
+            stage_totals[key] = stage_totals.get(key, 0) + value
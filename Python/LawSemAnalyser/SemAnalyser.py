@@ -1,32 +1,141 @@
 # coding: UTF-8
+import asyncio
 import codecs
 import collections
+import hashlib
+import io
+import itertools
 import json
+import logging
 import os
 import shutil
 import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Generator
 import docker
 import regex as re
-from bs4 import BeautifulSoup
 from tqdm import tqdm
 
+from .AnnotationCache import AnnotationCache
+from .ColumnarOutput import ColumnarOutput
+from .CorpusIndex import CorpusIndex
+from .DocumentPartitioner import DocumentPartitioner
 from .HTMLExtractor import HTMLExtractor
+from .InputSource import InputSource
+from .JSONEngine import JSONEngine
+from .Liner2Chunker import Liner2Chunker
+from .Liner2Daemon import Liner2Daemon
+from .Liner2Output import Liner2Output
+from .Liner2Scheduler import DockerLiner2Runner, Liner2Scheduler
+from .LinkGraph import LinkGraph
+from .OutputReader import OutputReader
+from .RunMetrics import RunMetrics
+
+logger = logging.getLogger(__name__)
+
+
+def _progress(iterable):
+    # progress bars only when INFO messages are shown
+    return tqdm(iterable, disable=not logger.isEnabledFor(logging.INFO))
+
+
+def _count_elements(result: dict) -> int:
+    return len(result["document"]["body"]) + len(result["document"]["glossary"])
+
+
+def _map_ordered(executor, function, items, in_flight: int):
+    # executor.map, but with at most in_flight results held at a time
+    futures = collections.deque()
+    for item in items:
+        if len(futures) >= in_flight:
+            yield futures.popleft().result()
+        futures.append(executor.submit(function, item))
+    while futures:
+        yield futures.popleft().result()
+
+
+def _read_html(html_extractor, content: bytes):
+    return html_extractor.read_html(io.StringIO(InputSource.decode(content)))
+
+
+def _extract_html_file(html_extractor, name: str, content: bytes) -> tuple:
+    # runs in a worker process - only the plain result dict and the stage
+    # metrics are sent back
+    events = []
+    metrics = RunMetrics(callback=events.append)
+    with metrics.stage("read", name, bytes_in=len(content)):
+        soup = _read_html(html_extractor, content)
+    with metrics.stage("extract", name) as counters:
+        result = html_extractor.extract_html(soup).result
+        html_extractor.release_html(soup)
+        counters["elements"] = _count_elements(result)
+    return result, events
+
+
+def _extract_html_part(html_extractor, name: str, units: list, html: str) -> tuple:
+    # the same for a partition of a document made by DocumentPartitioner
+    events = []
+    metrics = RunMetrics(callback=events.append)
+    with metrics.stage("read", name):
+        soup = html_extractor.read_html(io.StringIO(html))
+    with metrics.stage("extract", name) as counters:
+        result = html_extractor.extract_html_part(soup, units).result
+        html_extractor.release_html(soup)
+        counters["elements"] = _count_elements(result)
+    return result, events
 
 
 class SemAnalyser(object):
+    LINER2_OUTPUT_SUFFIX = ".txt.json"
+    MANIFEST_NAME = "manifest.json"
+    OUTPUT_SUFFIXES = {"json": ".json", "columnar": ".columnar.json"}
+    LINER2_CHUNKS_NAME = "liner2_chunks.json"
+    DOCKER_IMAGES_NAME = "docker_images.json"
+    LINER2_EXCHANGES = ("disk", "tmpfs")
+    # seconds between looks for finished Liner2 output files
+    LINER2_POLL_INTERVAL = 0.5
+
     def __init__(
         self,
         output_path: str,
         html_docs_path: str,
-        html_extractor=HTMLExtractor(),
+        html_extractor=None,
         temp_path="temp",
         json_output_path=None,
         liner2_output_path=None,
         docker_image="yard1/liner2-cli:latest",
+        workers=1,
+        liner2_backend="batch",
+        liner2_connections=4,
+        liner2_daemon_address=None,
+        cache_path=None,
+        cache_size=1024 ** 3,
+        liner2_batch_size=None,
+        liner2_shards=1,
+        liner2_concurrency=None,
+        liner2_retries=2,
+        docker_endpoints=None,
+        liner2_runners=None,
+        output_format="json",
+        output_index=False,
+        index_path=None,
+        link_graph_path=None,
+        metrics_callback=None,
+        report_path=None,
+        profile_stages=None,
+        docker_client=None,
+        refresh_docker_image=False,
+        skip_ner=False,
+        json_engine=None,
+        output_compression=None,
+        load_threads=4,
+        partition_size=1024 ** 2,
+        liner2_exchange="disk",
+        liner2_tmpfs_path="/dev/shm",
     ):
         self.output_path = output_path
         self.html_docs_path = html_docs_path
-        self.html_extractor = html_extractor
+        self.html_extractor = html_extractor if html_extractor else HTMLExtractor()
         self.temp_path = temp_path
         if not json_output_path:
             self.json_output_path = os.path.join(self.output_path, "json")
@@ -37,92 +146,771 @@ class SemAnalyser(object):
         else:
             self.liner2_output_path = liner2_output_path
         self.docker_image = docker_image
+        # extraction only, Docker is never used
+        self.skip_ner = skip_ner
+        if output_format not in self.OUTPUT_SUFFIXES:
+            raise ValueError(f"Unknown output format {output_format}")
+        self.output_format = output_format
+        self.output_index = output_index
+        # orjson, msgspec or json, the first one installed by default
+        self.json_engine = JSONEngine(json_engine, default=Liner2Output.json_default)
+        JSONEngine.check_compression(output_compression)
+        if output_compression and output_index:
+            raise ValueError("output_index needs uncompressed output")
+        self.output_compression = output_compression
+        # threads reading Liner2 output files
+        self.load_threads = load_threads
+        # inverted index over the Liner2 output of all analysed documents
+        self.corpus_index = None
+        if index_path:
+            self.corpus_index = CorpusIndex(index_path)
+        # links between elements of all extracted documents
+        self.link_graph = None
+        if link_graph_path:
+            self.link_graph = LinkGraph(link_graph_path)
+        # timings and counters of every run, see RunMetrics
+        self.metrics_callback = metrics_callback
+        self.report_path = report_path
+        self.profile_stages = profile_stages
+        self.metrics = RunMetrics(metrics_callback, profile_stages)
+        self.workers = workers
+        # with several workers, documents over partition_size bytes are split
+        # into partitions extracted in parallel
+        self.partition_size = partition_size
+        self.document_partitioner = None
+        if partition_size:
+            self.document_partitioner = DocumentPartitioner(partition_size)
+        self.liner2_backend = liner2_backend
+        # with "tmpfs", Liner2 batch inputs and outputs go through a directory
+        # made under liner2_tmpfs_path for each run instead of temp_path and
+        # liner2_output_path
+        if liner2_exchange not in self.LINER2_EXCHANGES:
+            raise ValueError(f"Unknown Liner2 exchange {liner2_exchange}")
+        self.liner2_exchange = liner2_exchange
+        self.liner2_tmpfs_path = liner2_tmpfs_path
+        self.liner2_connections = liner2_connections
+        self.liner2_daemon_address = liner2_daemon_address
+        self.liner2_daemon = None
+        # pack elements into Liner2 inputs of about liner2_batch_size characters
+        self.liner2_chunker = None
+        if liner2_batch_size:
+            self.liner2_chunker = Liner2Chunker(liner2_batch_size)
         if not os.path.exists(self.output_path):
             os.makedirs(self.output_path)
         if not os.path.exists(self.json_output_path):
             os.makedirs(self.json_output_path)
+        self.manifest_path = os.path.join(self.output_path, self.MANIFEST_NAME)
+        self.manifest = self._load_manifest()
+        self.liner2_chunks_path = os.path.join(
+            self.output_path, self.LINER2_CHUNKS_NAME
+        )
+        self.html_hashes = {}
+
+        # Docker is connected to, and the image resolved, on first use. The
+        # image ID is kept in docker_images.json, and the image is only
+        # pulled when it is not there locally or refresh_docker_image is set.
+        self._docker_client = docker_client
+        self._docker_image_digest = None
+        self.docker_images_path = os.path.join(
+            self.output_path, self.DOCKER_IMAGES_NAME
+        )
+        self.refresh_docker_image = refresh_docker_image
+        self.docker_endpoints = docker_endpoints
+        self.liner2_runners = liner2_runners
+        self.liner2_shards = liner2_shards
+        self.liner2_concurrency = liner2_concurrency
+        self.liner2_retries = liner2_retries
+        self.liner2_scheduler = None
+        self.cache_path = cache_path
+        self.cache_size = cache_size
+        self.annotation_cache = None
+
+    @property
+    def docker_client(self):
+        if not self._docker_client:
+            self._docker_client = docker.from_env()
+        return self._docker_client
+
+    @property
+    def docker_image_digest(self) -> str:
+        if self.skip_ner:
+            return None
+        if not self._docker_image_digest:
+            self._docker_image_digest = self._resolve_docker_image()
+        return self._docker_image_digest
+
+    def analyse_docs(
+        self, stream=False, window_size=1, workers=None, force=False, pipeline=False
+    ):
+        if pipeline:
+            asyncio.run(self.analyse_docs_async(window_size, workers, force))
+            return
+        if workers is None:
+            workers = self.workers
+        self.metrics = RunMetrics(self.metrics_callback, self.profile_stages)
+        docs = self._iter_input_docs(force)
+        if stream:
+            self._analyse_docs_streaming(window_size, workers, docs, force)
+        else:
+            self._prepare_docs(workers, docs, force)
+            self._annotate(self.html_data)
+            self._save_txt_files(self.html_data)
+            self._update_manifest(self.html_data)
+            self._update_corpus_index(self.html_data)
+        self._finish_run()
+
+    async def analyse_docs_async(
+        self, window_size=1, workers=None, force=False, queue_size=None
+    ):
+        # Extraction, NER and writing run as stages connected by bounded
+        # queues: while a window of documents is annotated, the next ones are
+        # extracted and the previous window is written. At most queue_size
+        # extracted documents (window_size by default) and one annotated window
+        # wait between the stages.
+        if workers is None:
+            workers = self.workers
+        self.metrics = RunMetrics(self.metrics_callback, self.profile_stages)
+        extracted = asyncio.Queue(maxsize=queue_size or window_size)
+        annotated = asyncio.Queue(maxsize=1)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            # documents are selected as the extraction stage reads them
+            docs = self._iter_input_docs(force)
+            tasks = [
+                asyncio.ensure_future(x)
+                for x in (
+                    self._extract_stage(executor, extracted, workers, docs),
+                    self._annotate_stage(
+                        executor, extracted, annotated, window_size, force
+                    ),
+                    self._write_stage(executor, annotated),
+                )
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+        self._finish_run()
+
+    def _resolve_docker_image(self) -> str:
+        images = {}
+        if os.path.exists(self.docker_images_path):
+            with codecs.open(self.docker_images_path, encoding="utf8") as f:
+                images = json.load(f)
+        if not self.refresh_docker_image and self.docker_image in images:
+            return images[self.docker_image]
+        image = None
+        if not self.refresh_docker_image:
+            try:
+                image = self.docker_client.images.get(self.docker_image)
+            except docker.errors.ImageNotFound:
+                pass
+        if not image:
+            logger.info("Pulling Docker image %s...", self.docker_image)
+            image = self.docker_client.images.pull(self.docker_image)
+        images[self.docker_image] = image.id
+        temp_path = self.docker_images_path + ".tmp"
+        with codecs.open(temp_path, "w", encoding="utf8") as f:
+            json.dump(images, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.docker_images_path)
+        return image.id
+
+    def _start_liner2_scheduler(self):
+        if self.liner2_scheduler:
+            return
+        liner2_runners = self.liner2_runners
+        if not liner2_runners:
+            # one runner per Docker endpoint, the local one by default
+            docker_clients = [self.docker_client]
+            if self.docker_endpoints:
+                docker_clients = [
+                    docker.DockerClient(base_url=x) for x in self.docker_endpoints
+                ]
+            liner2_runners = [
+                DockerLiner2Runner(x, self.docker_image) for x in docker_clients
+            ]
+        self.liner2_scheduler = Liner2Scheduler(
+            liner2_runners,
+            self.liner2_shards,
+            self.liner2_concurrency,
+            self.liner2_retries,
+        )
+
+    def _open_annotation_cache(self):
+        if self.cache_path and not self.annotation_cache:
+            self.annotation_cache = AnnotationCache(
+                self.cache_path, self.cache_size, salt=self.docker_image_digest
+            )
+
+    def close(self):
+        if self.liner2_daemon:
+            self.liner2_daemon.stop()
+            self.liner2_daemon = None
+
+    def _finish_run(self):
+        self._index_remaining_docs()
+        self._save_link_graph()
+        self._print_cache_stats()
+        if self.report_path:
+            self.metrics.save_report(self.report_path)
+            logger.info("Run report saved to %s", self.report_path)
+
+    def _print_cache_stats(self):
+        if self.annotation_cache:
+            logger.info(
+                "Annotation cache: %d hits, %d misses",
+                self.annotation_cache.hits,
+                self.annotation_cache.misses,
+            )
+
+    def _analyse_docs_streaming(
+        self, window_size: int, workers: int, docs=None, force=False
+    ):
+        docs = self._iter_docs(workers, docs)
+        while True:
+            html_data = collections.OrderedDict(itertools.islice(docs, window_size))
+            if not html_data:
+                break
+            self._annotate_window(html_data, force)
+            self._save_window(html_data)
+
+    def _iter_docs(self, workers: int, docs=None) -> Generator[tuple, None, None]:
+        if workers > 1:
+            return self._iter_extracted_parallel(workers, docs)
+        return self._iter_extracted(self._iter_html_files(docs))
+
+    def _annotate_window(self, html_data: dict, force=False):
+        if not force:
+            self._reuse_previous_liner2_output(html_data)
+        self._annotate(html_data)
 
-        if os.path.exists(self.temp_path):
-            shutil.rmtree(self.temp_path)
-        os.makedirs(self.temp_path)
-        if os.path.exists(self.liner2_output_path):
-           shutil.rmtree(self.liner2_output_path)
-        os.makedirs(self.liner2_output_path)
-        self.docker_client = docker.from_env()
-        self.docker_client.images.pull(docker_image)
-
-    def analyse_docs(self):
-        self._prepare_docs()
-        self._run_liner2()
-        self._load_liner2_output()
-        self._save_txt_files()
-
-    def _prepare_docs(self):
-        print("Generating files ...")
-        self.html_files = self._read_html_files()
-        self.html_data = self._extract_from_html()
-        self._save_txt_files()
-
-    def _save_txt_files(self):
-        for file_name, data in self.html_data.items():
-            path = os.path.join(self.json_output_path, file_name + ".json")
-            print("Saving txt file " + path + "...")
-            with codecs.open(path, "w", encoding="utf8") as output_file:
-                json.dump(
-                    data.result, output_file, ensure_ascii=False, separators=(",", ":")
+    def _save_window(self, html_data: dict):
+        self._save_txt_files(html_data)
+        self._update_manifest(html_data)
+        self._update_corpus_index(html_data)
+
+    async def _extract_stage(
+        self, executor, extracted: asyncio.Queue, workers: int, docs=None
+    ):
+        loop = asyncio.get_running_loop()
+        docs = self._iter_docs(workers, docs)
+        while True:
+            doc = await loop.run_in_executor(executor, next, docs, None)
+            # None also tells the next stage that there is nothing more
+            await extracted.put(doc)
+            if doc is None:
+                break
+
+    async def _annotate_stage(
+        self,
+        executor,
+        extracted: asyncio.Queue,
+        annotated: asyncio.Queue,
+        window_size: int,
+        force: bool,
+    ):
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            html_data = collections.OrderedDict()
+            while len(html_data) < window_size:
+                doc = await extracted.get()
+                if doc is None:
+                    done = True
+                    break
+                html_data[doc[0]] = doc[1]
+            if html_data:
+                await loop.run_in_executor(
+                    executor, self._annotate_window, html_data, force
                 )
+                await annotated.put(html_data)
+        await annotated.put(None)
+
+    async def _write_stage(self, executor, annotated: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            html_data = await annotated.get()
+            if html_data is None:
+                break
+            await loop.run_in_executor(executor, self._save_window, html_data)
+
+    def _reset_liner2_dirs(self):
+        for path in (self.temp_path, self.liner2_output_path):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.makedirs(path)
+
+    def _prepare_docs(self, workers=1, docs=None, force=False):
+        logger.info("Generating files ...")
+        if workers > 1:
+            self.html_files = {}
+            self.html_data = collections.OrderedDict(
+                self._iter_extracted_parallel(workers, docs)
+            )
+        else:
+            self.html_files = self._read_html_files(docs)
+            self.html_data = self._extract_from_html()
+        if not force:
+            self._reuse_previous_liner2_output(self.html_data)
+
+    def _save_txt_files(self, html_data: dict):
+        for file_name, data in html_data.items():
+            path = os.path.join(self.json_output_path, self._output_name(file_name))
+            logger.debug("Saving txt file %s...", path)
+            with self.metrics.stage("write", file_name) as counters:
+                self._save_txt_file(path, data)
+                counters["bytes_out"] = os.path.getsize(path)
+
+    def _save_txt_file(self, path: str, data: dict):
+        if self.output_format == "columnar":
+            data = ColumnarOutput.encode(data)
+        if self.output_index:
+            # the same bytes as json.dump, plus the offset of every element
+            temp_path = path + ".tmp"
+            with open(temp_path, "wb") as output_file:
+                index = OutputReader.dump(data, output_file)
+            os.replace(temp_path, path)
+            OutputReader.save_index(path, index)
+            return
+        self.json_engine.dump(data, path, self.output_compression)
+
+    def _output_name(self, file_name: str) -> str:
+        return (
+            file_name
+            + self.OUTPUT_SUFFIXES[self.output_format]
+            + JSONEngine.COMPRESSION_SUFFIXES.get(self.output_compression, "")
+        )
+
+    def _load_manifest(self) -> dict:
+        if os.path.exists(self.manifest_path):
+            with codecs.open(self.manifest_path, encoding="utf8") as f:
+                return json.load(f)
+        return {"documents": {}}
+
+    def _save_manifest(self):
+        temp_path = self.manifest_path + ".tmp"
+        with codecs.open(temp_path, "w", encoding="utf8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.manifest_path)
+
+    def _manifest_entry(self, file_name: str) -> dict:
+        return {
+            "html_sha256": self.html_hashes.get(file_name),
+            "extractor_version": self.html_extractor.VERSION,
+            "liner2_image": self.docker_image_digest,
+            "output": self._output_name(file_name),
+        }
+
+    def _update_manifest(self, html_data: dict):
+        for file_name in html_data:
+            self.manifest["documents"][file_name] = self._manifest_entry(file_name)
+        self._save_manifest()
+
+    def _update_corpus_index(self, html_data: dict):
+        if self.corpus_index:
+            with self.metrics.stage("index", documents=len(html_data)):
+                self.corpus_index.update(html_data)
+
+    def _index_remaining_docs(self, batch_size=100):
+        # documents skipped as unchanged but missing from the index, e.g. when
+        # it is first built, are indexed from their outputs
+        if not self.corpus_index:
+            return
+        indexed = set(self.corpus_index.documents())
+        names = [x for x in sorted(self.manifest["documents"]) if x not in indexed]
+        if not names:
+            return
+        logger.info("Indexing %d previously analysed documents...", len(names))
+        for i in _progress(range(0, len(names), batch_size)):
+            html_data = collections.OrderedDict()
+            for file_name in names[i : i + batch_size]:
+                output_path = os.path.join(
+                    self.json_output_path,
+                    self.manifest["documents"][file_name]["output"],
+                )
+                if os.path.exists(output_path):
+                    html_data[file_name] = ColumnarOutput.load(
+                        output_path, json_engine=self.json_engine
+                    )
+            self._update_corpus_index(html_data)
+
+    def _add_to_link_graph(self, file_name: str, result: dict):
+        if self.link_graph:
+            self.link_graph.add_document(file_name, result)
+
+    def _save_link_graph(self):
+        # documents skipped as unchanged but missing from the graph are added
+        # from their outputs, whose elements keep their links
+        if not self.link_graph:
+            return
+        with self.metrics.stage("link_graph"):
+            for file_name, entry in sorted(self.manifest["documents"].items()):
+                output_path = os.path.join(self.json_output_path, entry["output"])
+                if file_name not in self.link_graph.documents and os.path.exists(
+                    output_path
+                ):
+                    self.link_graph.add_document(
+                        file_name,
+                        ColumnarOutput.load(
+                            output_path, decode=False, json_engine=self.json_engine
+                        ),
+                    )
+            self.link_graph.save()
+
+    def _reuse_previous_liner2_output(self, html_data: dict):
+        # elements of an amended act that kept their type, id and content get
+        # the Liner2 output of the previous analysis instead of a new one
+        if self.skip_ner:
+            return
+        for file_name, data in html_data.items():
+            with self.metrics.stage("reuse", file_name) as counters:
+                counters["elements"] = self._reuse_previous_elements(file_name, data)
+
+    def _reuse_previous_elements(self, file_name: str, data: dict) -> int:
+        previous = self._load_previous_output(file_name)
+        if not previous:
+            return 0
+        previous = previous["document"]
+        previous_elements = {}
+        for element in previous["body"] + previous["glossary"]:
+            if element.get("liner2") is not None:
+                previous_elements.setdefault(
+                    (element["type"], element["id"]),
+                    (
+                        self._content_hash(element["content"]),
+                        Liner2Output.compact(element["liner2"]),
+                    ),
+                )
+        elements = data["document"]["body"] + data["document"]["glossary"]
+        reused = 0
+        for element in elements:
+            content_hash, liner2_output = previous_elements.get(
+                (element["type"], element["id"]), (None, None)
+            )
+            if content_hash == self._content_hash(element["content"]):
+                element["liner2"] = liner2_output
+                reused += 1
+        logger.debug(
+            "Reusing Liner2 output of %d/%d elements of %s...",
+            reused,
+            len(elements),
+            file_name,
+        )
+        return reused
+
+    def _load_previous_output(self, file_name: str):
+        entry = self.manifest["documents"].get(file_name)
+        if not entry or entry["liner2_image"] != self.docker_image_digest:
+            return None
+        path = os.path.join(self.json_output_path, entry["output"])
+        if not os.path.exists(path):
+            return None
+        # either output format
+        return ColumnarOutput.load(path, json_engine=self.json_engine)
 
-    def _read_html_files(self) -> dict:
-        html_files = {}
-        for name in os.listdir(self.html_docs_path):
-            print("Reading file " + os.path.join(self.html_docs_path, name) + "...")
-            if os.path.isfile(os.path.join(self.html_docs_path, name)):
-                try:
-                    with codecs.open(
-                        os.path.join(self.html_docs_path, name), encoding="utf-8"
-                    ) as input_file:
-                        html_files[name] = BeautifulSoup(input_file, "lxml")
-                except UnicodeDecodeError:
-                    with codecs.open(
-                        os.path.join(self.html_docs_path, name), encoding="iso-8859-2"
-                    ) as input_file:
-                        html_files[name] = BeautifulSoup(input_file, "lxml")
-        return html_files
+    @staticmethod
+    def _content_hash(content: str) -> str:
+        return hashlib.sha1(content.encode("utf8")).hexdigest()
+
+    def _iter_input_docs(self, force: bool) -> Generator[tuple, None, None]:
+        # (name, raw bytes) of the documents to analyse, read from
+        # html_docs_path as they are asked for; documents whose input,
+        # extractor and Liner2 image are all unchanged since their output was
+        # written are skipped
+        documents = iter(InputSource.open(self.html_docs_path))
+        while True:
+            with self.metrics.stage("select", bytes_in=0) as counters:
+                document = next(documents, None)
+                if document is None:
+                    break
+                name, content = document
+                counters["bytes_in"] = len(content)
+                # hashed even with force, for the manifest
+                self.html_hashes[name] = hashlib.sha256(content).hexdigest()
+                unchanged = not force and self._is_unchanged(name)
+            if unchanged:
+                logger.debug("Skipping unchanged %s...", name)
+                continue
+            yield document
+
+    def _is_unchanged(self, name: str) -> bool:
+        entry = self.manifest["documents"].get(name)
+        expected = self._manifest_entry(name)
+        if self.skip_ner and entry:
+            # annotated output is as good as extraction only output
+            expected["liner2_image"] = entry["liner2_image"]
+        return entry == expected and os.path.exists(
+            os.path.join(self.json_output_path, entry["output"])
+        )
+
+    def _read_html_files(self, docs=None) -> dict:
+        return dict(self._iter_html_files(docs))
+
+    def _iter_html_files(self, docs=None) -> Generator[tuple, None, None]:
+        if docs is None:
+            docs = self._iter_input_docs(force=True)
+        for name, content in docs:
+            logger.debug("Reading file %s...", os.path.join(self.html_docs_path, name))
+            with self.metrics.stage("read", name, bytes_in=len(content)):
+                soup = _read_html(self.html_extractor, content)
+            yield name, soup
 
     def _extract_from_html(self) -> collections.defaultdict:
         data_collections = collections.defaultdict(collections.OrderedDict)
-        for file_name in self.html_files:
-            print(
-                "Processing html file "
-                + os.path.join(self.html_docs_path, file_name)
-                + "..."
-            )
-            data_collections[file_name] = self.html_extractor.extract_html(
-                self.html_files[file_name]
+        for file_name in list(self.html_files):
+            logger.debug(
+                "Processing html file %s...",
+                os.path.join(self.html_docs_path, file_name),
             )
+            with self.metrics.stage("extract", file_name) as counters:
+                soup = self.html_files.pop(file_name)
+                data_collections[file_name] = self.html_extractor.extract_html(
+                    soup
+                ).result
+                self.html_extractor.release_html(soup)
+                counters["elements"] = _count_elements(data_collections[file_name])
+            self._add_to_link_graph(file_name, data_collections[file_name])
 
         return data_collections
 
-    def _prepare_liner2_input(self):
-        for filename, data in self.html_data.items():
-            print(f"Preparing {filename} for liner2...")
-            data = data.result["document"]
-            for element in tqdm(data["body"] + data["glossary"]):
-                element["liner2"] = self._save_text_for_liner2(
-                    element["content"], f"{filename}.{element['type']}.{element['id']}"
+    def _iter_extracted(self, html_files) -> Generator[tuple, None, None]:
+        for file_name, soup in html_files:
+            logger.debug(
+                "Processing html file %s...",
+                os.path.join(self.html_docs_path, file_name),
+            )
+            with self.metrics.stage("extract", file_name) as counters:
+                result = self.html_extractor.extract_html(soup).result
+                self.html_extractor.release_html(soup)
+                counters["elements"] = _count_elements(result)
+            self._add_to_link_graph(file_name, result)
+            yield file_name, result
+
+    def _iter_extracted_parallel(
+        self, workers: int, docs=None
+    ) -> Generator[tuple, None, None]:
+        # keep a bounded number of documents in flight so streaming stays bounded
+        docs = iter(self._iter_input_docs(force=True) if docs is None else docs)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = collections.deque()
+            for doc in itertools.islice(docs, workers * 2):
+                pending.append(self._submit_extraction(executor, *doc))
+            while pending:
+                file_name, futures = pending.popleft()
+                next_doc = next(docs, None)
+                if next_doc is not None:
+                    pending.append(self._submit_extraction(executor, *next_doc))
+                results = []
+                for future in futures:
+                    result, events = future.result()
+                    for event in events:
+                        self.metrics.record(**event)
+                    results.append(result)
+                result = self._join_partitions(results)
+                self._add_to_link_graph(file_name, result)
+                yield file_name, result
+
+    def _submit_extraction(
+        self, executor: ProcessPoolExecutor, file_name: str, content: bytes
+    ) -> tuple:
+        logger.debug(
+            "Processing html file %s...", os.path.join(self.html_docs_path, file_name)
+        )
+        partitions = None
+        if self.document_partitioner and len(content) > self.partition_size:
+            partitions = self._split_html_file(file_name, content)
+        if not partitions:
+            return (
+                file_name,
+                [
+                    executor.submit(
+                        _extract_html_file, self.html_extractor, file_name, content
+                    )
+                ],
+            )
+        return (
+            file_name,
+            [
+                executor.submit(
+                    _extract_html_part, self.html_extractor, file_name, units, html
                 )
+                for units, html in partitions
+            ],
+        )
+
+    def _split_html_file(self, file_name: str, content: bytes):
+        # None when the document is not split, including documents whose
+        # structure the partitioner does not know
+        with self.metrics.stage(
+            "partition", file_name, bytes_in=len(content)
+        ) as counters:
+            try:
+                partitions = self.document_partitioner.split(
+                    _read_html(self.document_partitioner, content)
+                )
+            except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+                logger.debug("Extracting %s as a whole", file_name)
+                return None
+            counters["partitions"] = len(partitions)
+        logger.debug("Split %s into %d partitions", file_name, len(partitions))
+        return partitions if len(partitions) > 1 else None
 
-    def _save_text_for_liner2(self, text: str, filename: str):
-        with codecs.open(f"temp/{filename}.txt", "w", encoding="utf8") as f:
+    @staticmethod
+    def _join_partitions(results: list) -> dict:
+        if len(results) == 1:
+            return results[0]
+        return {
+            "type": results[0]["type"],
+            "document": {
+                "body": [x for y in results for x in y["document"]["body"]],
+                "glossary": [x for y in results for x in y["document"]["glossary"]],
+            },
+        }
+
+    def _annotate(self, html_data: dict):
+        if self.skip_ner:
+            return
+        liner2_elements = self._collect_liner2_elements(html_data)
+        self._open_annotation_cache()
+        if self.annotation_cache:
+            liner2_elements = self._load_cached_liner2_output(liner2_elements)
+        if not liner2_elements:
+            return
+        unsplit = self._run_liner2_backend(liner2_elements)
+        if unsplit:
+            logger.warning(
+                "Annotating %d elements of chunks that could not be split one by one",
+                len(unsplit),
+            )
+            self._run_liner2_backend(
+                {x: liner2_elements[x] for x in unsplit}, chunked=False
+            )
+        if self.annotation_cache:
+            self._save_liner2_output_to_cache(liner2_elements)
+
+    def _run_liner2_backend(self, liner2_elements: dict, chunked=True) -> list:
+        # returns the names of the elements of chunks whose output could not
+        # be split
+        if self.liner2_backend == "daemon":
+            return self._run_liner2_daemon(liner2_elements, chunked)
+        return self._run_liner2(liner2_elements, chunked)
+
+    def _collect_liner2_elements(self, html_data: dict) -> dict:
+        # maps each Liner2 input name - "{document}.{type}.{id}" - to its element
+        liner2_elements = {}
+        for filename, data in html_data.items():
+            logger.debug("Preparing %s for liner2...", filename)
+            data = data["document"]
+            for element in data["body"] + data["glossary"]:
+                if element.get("liner2") is not None:
+                    # already annotated by a previous analysis
+                    continue
+                element["liner2"] = None
+                # an element repeating a (type, id) pair is annotated through
+                # the first one
+                liner2_elements.setdefault(
+                    f"{filename}.{element['type']}.{element['id']}", element
+                )
+        return liner2_elements
+
+    def _load_cached_liner2_output(self, liner2_elements: dict) -> dict:
+        # returns the elements that still have to go through Liner2
+        missing = {}
+        for name, element in liner2_elements.items():
+            liner2_output = self.annotation_cache.get(element["content"])
+            if liner2_output is None:
+                missing[name] = element
+            else:
+                self._append_liner2_output(element, liner2_output)
+        return missing
+
+    def _save_liner2_output_to_cache(self, liner2_elements: dict):
+        for element in liner2_elements.values():
+            if element["liner2"] is not None:
+                self.annotation_cache.put(
+                    element["content"], Liner2Output.expand(element["liner2"])
+                )
+
+    def _prepare_liner2_input(
+        self, liner2_elements: dict, input_path: str, chunked=True
+    ):
+        with self.metrics.stage(
+            "liner2_prepare", elements=len(liner2_elements)
+        ) as counters:
+            if chunked and self.liner2_chunker:
+                self._prepare_liner2_chunks(liner2_elements, input_path)
+            else:
+                for name, element in _progress(liner2_elements.items()):
+                    self._save_text_for_liner2(element["content"], name, input_path)
+            counters["bytes_out"] = sum(
+                x.stat().st_size for x in os.scandir(input_path) if x.is_file()
+            )
+
+    def _prepare_liner2_chunks(self, liner2_elements: dict, input_path: str):
+        chunks, singles = self._pack_liner2_chunks(liner2_elements)
+        logger.info(
+            "Packed %d elements into %d chunks", len(liner2_elements), len(chunks)
+        )
+        for name, (text, _) in _progress(chunks.items()):
+            self._save_text_for_liner2(text, name, input_path)
+        for name in singles:
+            self._save_text_for_liner2(
+                liner2_elements[name]["content"], name, input_path
+            )
+        # the offset map is kept outside of the Liner2 input and output
+        # directories, both of which Liner2 reads or writes as a whole
+        with open(self.liner2_chunks_path, "w", encoding="utf8") as f:
+            json.dump(
+                {name: offsets for name, (_, offsets) in chunks.items()},
+                f,
+                ensure_ascii=False,
+                indent=1,
+            )
+
+    def _pack_liner2_chunks(self, liner2_elements: dict) -> tuple:
+        # (chunks, names of the elements that go to Liner2 on their own):
+        # empty texts cannot be told apart in a chunk
+        texts = {name: x["content"].strip() for name, x in liner2_elements.items()}
+        return (
+            self.liner2_chunker.pack({k: v for k, v in texts.items() if v}),
+            [k for k, v in texts.items() if not v],
+        )
+
+    def _split_liner2_chunk(
+        self, liner2_elements: dict, liner2_output: dict, offsets: list
+    ) -> list:
+        # returns the names of the elements of the chunk when its output
+        # cannot be split, and merges nothing then
+        names = [x[0] for x in offsets]
+        try:
+            texts = {}
+            for name, _, length in offsets:
+                texts[name] = liner2_elements[name]["content"].strip()
+                if len(texts[name]) != length:
+                    raise ValueError(f"{name} changed since it was packed")
+            outputs = self.liner2_chunker.split(liner2_output, texts)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning("Cannot split the Liner2 output of a chunk: %r", e)
+            return [x for x in names if x in liner2_elements]
+        for name, output in outputs.items():
+            self._append_liner2_output(liner2_elements[name], output)
+        return []
+
+    def _save_text_for_liner2(self, text: str, filename: str, input_path: str):
+        with codecs.open(
+            os.path.join(input_path, f"{filename}.txt"), "w", encoding="utf8"
+        ) as f:
             f.write(text.strip())
 
     def _append_liner2_output(self, element: dict, liner2_output: dict):
+        # the output is kept compact, see Liner2Output
         try:
             if (
                 "liner2" in element
                 and element["liner2"]
                 and "annotations" in element["liner2"]
             ):
+                element["liner2"] = Liner2Output.expand(element["liner2"])
                 element["liner2"]["annotations"].extend(liner2_output["annotations"])
                 if element["liner2"]["annotations"]:
                     element["liner2"]["annotations"].sort(
@@ -130,56 +918,211 @@ class SemAnalyser(object):
                     )
                     for i, x in enumerate(element["liner2"]["annotations"]):
                         x["id"] = f"a{i+1}"
+                element["liner2"] = Liner2Output.compact(element["liner2"])
             else:
-                element["liner2"] = liner2_output.copy()
+                element["liner2"] = Liner2Output.compact(liner2_output.copy())
         except:
-            element["liner2"] = liner2_output.copy()
-
-    def _load_liner2_output(self):
-        for name in tqdm(sorted(os.listdir(self.liner2_output_path))):
-            liner2_output = None
-            with open(os.path.join(self.liner2_output_path, name), "r") as f:
-                liner2_output = json.load(f)
-            current_html_file = None
-            for html_filename in self.html_data.keys():
-                if name.startswith(html_filename):
-                    current_html_file = html_filename
-                    break
-            if not current_html_file:
-                print(f"{name} doesn't match any html file")
+            element["liner2"] = Liner2Output.compact(liner2_output.copy())
+
+    def _load_liner2_output(
+        self, liner2_elements: dict, output_path: str, running=None
+    ):
+        # While running - the future of the Liner2 run - is not done, output
+        # files are merged as soon as Liner2 has finished writing them: their
+        # size stayed the same since the last look and they parse. The rest
+        # is merged once it is done.
+        liner2_chunks = {}
+        if self.liner2_chunker and os.path.exists(self.liner2_chunks_path):
+            with open(self.liner2_chunks_path, "r", encoding="utf8") as f:
+                liner2_chunks = json.load(f)
+        loaded = set()
+        sizes = {}
+        unsplit = []
+        with ThreadPoolExecutor(max_workers=self.load_threads) as executor:
+            while running is not None and not running.done():
+                wait([running], timeout=self.LINER2_POLL_INTERVAL)
+                finished = []
+                for entry in sorted(os.scandir(output_path), key=lambda x: x.name):
+                    if entry.name in loaded:
+                        continue
+                    size = entry.stat().st_size
+                    if size and sizes.get(entry.name) == size:
+                        finished.append(entry.name)
+                    sizes[entry.name] = size
+                unsplit += self._merge_liner2_outputs(
+                    executor,
+                    liner2_elements,
+                    liner2_chunks,
+                    output_path,
+                    finished,
+                    loaded,
+                )
+            if running is not None:
+                running.result()
+            unsplit += self._merge_liner2_outputs(
+                executor,
+                liner2_elements,
+                liner2_chunks,
+                output_path,
+                [x for x in sorted(os.listdir(output_path)) if x not in loaded],
+                loaded,
+                last=True,
+            )
+        if liner2_chunks:
+            os.remove(self.liner2_chunks_path)
+        return unsplit
+
+    def _merge_liner2_outputs(
+        self,
+        executor: ThreadPoolExecutor,
+        liner2_elements: dict,
+        liner2_chunks: dict,
+        output_path: str,
+        names: list,
+        loaded: set,
+        last=False,
+    ) -> list:
+        # adds the names merged to loaded; until the last call, files that do
+        # not parse yet or match no input are left for later. Returns the
+        # elements of chunks that could not be split.
+        unsplit = []
+        outputs = []
+        for name in names:
+            element = None
+            offsets = None
+            if name.endswith(self.LINER2_OUTPUT_SUFFIX):
+                input_name = name[: -len(self.LINER2_OUTPUT_SUFFIX)]
+                element = liner2_elements.get(input_name)
+                offsets = liner2_chunks.get(input_name)
+            if element is None and offsets is None:
+                if last:
+                    logger.warning("%s doesn't match any html file", name)
                 continue
-            element_name = name.replace(current_html_file, "", 1)[1:-9].split(".")
-            element_name = (element_name[0], element_name[1])
-            body = self.html_data[current_html_file].result["document"]["body"]
-            glossary = self.html_data[current_html_file].result["document"]["glossary"]
-            element = next(
-                (
-                    x
-                    for x in body + glossary
-                    if x["type"] == element_name[0] and str(x["id"]) == element_name[1]
+            outputs.append((name, element, offsets))
+        if not outputs:
+            return unsplit
+        read = (
+            self._read_liner2_output_file
+            if last
+            else self._read_finished_liner2_output_file
+        )
+        with self.metrics.stage("liner2_load", bytes_in=0, tokens=0) as counters:
+            # the files are read and parsed in parallel, but merged in order
+            for (size, liner2_output), (name, element, offsets) in zip(
+                _map_ordered(
+                    executor,
+                    read,
+                    (os.path.join(output_path, x[0]) for x in outputs),
+                    2 * self.load_threads,
                 ),
-                None,
-            )
-            if element:
-                self._append_liner2_output(element, liner2_output)
+                _progress(outputs) if last else outputs,
+            ):
+                if liner2_output is None:
+                    continue
+                loaded.add(name)
+                counters["bytes_in"] += size
+                counters["tokens"] += self._count_tokens(liner2_output)
+                if offsets is None:
+                    self._append_liner2_output(element, liner2_output)
+                else:
+                    unsplit += self._split_liner2_chunk(
+                        liner2_elements, liner2_output, offsets
+                    )
+        return unsplit
 
-    def _run_liner2(self):
-        self._prepare_liner2_input()
-        print(f"Running Docker {self.docker_image}...")
-        self.docker_client.containers.run(
-            self.docker_image,
-            entrypoint="/liner2/liner2-batch.sh",
-            userns_mode="host",
-            volumes={
-                f"{os.getcwd()}/{self.temp_path}": {
-                    "bind": "/liner2/input",
-                    "mode": "rw",
-                },
-                f"{os.getcwd()}/{self.liner2_output_path}": {
-                    "bind": "/liner2/output",
-                    "mode": "rw",
-                },
-                tempfile.gettempdir(): {"bind": "/tmp", "mode": "rw"},
-            },
+    def _read_liner2_output_file(self, path: str) -> tuple:
+        data = JSONEngine.read_bytes(path)
+        return len(data), self.json_engine.loads(data)
+
+    def _read_finished_liner2_output_file(self, path: str) -> tuple:
+        # the output is None while Liner2 is still writing the file
+        data = JSONEngine.read_bytes(path)
+        try:
+            return len(data), self.json_engine.loads(data)
+        except ValueError:
+            return len(data), None
+
+    @staticmethod
+    def _count_tokens(liner2_output: dict) -> int:
+        return sum(
+            len(sentence["tokens"])
+            for chunk in liner2_output["chunks"]
+            for sentence in chunk["sentences"]
+        )
+
+    def _run_liner2_daemon(self, liner2_elements: dict, chunked=True) -> list:
+        if not self.liner2_daemon:
+            self.liner2_daemon = Liner2Daemon(
+                self.docker_client,
+                self.docker_image,
+                address=self.liner2_daemon_address,
+                connections=self.liner2_connections,
+            ).start()
+        logger.info(
+            "Annotating %d elements with the Liner2 daemon...", len(liner2_elements)
         )
-        print(f"Done running Docker {self.docker_image}...")
+        with self.metrics.stage(
+            "liner2", elements=len(liner2_elements), tokens=0
+        ) as counters:
+            # (text, element name or chunk offsets) of every request
+            requests = []
+            singles = list(liner2_elements)
+            if chunked and self.liner2_chunker:
+                chunks, singles = self._pack_liner2_chunks(liner2_elements)
+                requests = list(chunks.values())
+            requests += [(liner2_elements[x]["content"].strip(), x) for x in singles]
+            outputs = self.liner2_daemon.annotate_many(x[0] for x in requests)
+            unsplit = []
+            for (_, target), liner2_output in zip(requests, _progress(outputs)):
+                # as with a missing batch output, the elements stay unannotated
+                if liner2_output is None:
+                    continue
+                counters["tokens"] += self._count_tokens(liner2_output)
+                if isinstance(target, str):
+                    self._append_liner2_output(liner2_elements[target], liner2_output)
+                else:
+                    unsplit += self._split_liner2_chunk(
+                        liner2_elements, liner2_output, target
+                    )
+            return unsplit
+
+    def _run_liner2(self, liner2_elements: dict, chunked=True) -> list:
+        self._start_liner2_scheduler()
+        input_path, output_path = self._open_liner2_exchange()
+        try:
+            self._prepare_liner2_input(liner2_elements, input_path, chunked)
+            logger.info("Running Docker %s...", self.docker_image)
+            # the outputs are merged in this thread while Liner2 runs
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                running = executor.submit(
+                    self._run_liner2_scheduler,
+                    len(liner2_elements),
+                    input_path,
+                    output_path,
+                )
+                unsplit = self._load_liner2_output(
+                    liner2_elements, output_path, running
+                )
+            logger.info("Done running Docker %s...", self.docker_image)
+        finally:
+            self._close_liner2_exchange(input_path)
+        return unsplit
+
+    def _run_liner2_scheduler(self, elements: int, input_path: str, output_path: str):
+        with self.metrics.stage("liner2", elements=elements):
+            self.liner2_scheduler.run(input_path, output_path)
+
+    def _open_liner2_exchange(self) -> tuple:
+        # (input path, output path) of a Liner2 batch run
+        if self.liner2_exchange == "disk":
+            self._reset_liner2_dirs()
+            return self.temp_path, self.liner2_output_path
+        path = tempfile.mkdtemp(prefix="liner2_", dir=self.liner2_tmpfs_path)
+        paths = (os.path.join(path, "input"), os.path.join(path, "output"))
+        for x in paths:
+            os.makedirs(x)
+        return paths
+
+    def _close_liner2_exchange(self, input_path: str):
+        if self.liner2_exchange == "tmpfs":
+            shutil.rmtree(os.path.dirname(input_path))
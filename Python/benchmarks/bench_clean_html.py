@@ -0,0 +1,81 @@
+# coding: UTF-8
+# Micro-benchmark for HTMLExtractor._clean_html over the strings produced
+# from example_html. Compares against the previous implementation, which ran
+# two regex substitutions and one str.replace per entry of BAD_CHARS_TO_REPLACE.
+#
+#   $ python benchmarks/bench_clean_html.py [path/to/example_html]
+import codecs
+import os
+import sys
+import timeit
+
+import regex as re
+from bs4 import BeautifulSoup, NavigableString
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from LawSemAnalyser.HTMLExtractor import HTMLExtractor  # noqa: E402
+
+EXAMPLE_HTML = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "example_html"
+)
+
+
+class RecordingExtractor(HTMLExtractor):
+    # records every argument of _clean_html, strings and tags as they are
+    def __init__(self):
+        super().__init__()
+        self.inputs = []
+
+    def _clean_html(self, html_string: str) -> str:
+        self.inputs.append(html_string)
+        return super()._clean_html(html_string)
+
+
+def clean_html_loop(extractor: HTMLExtractor, html_string: str) -> str:
+    text = re.sub(
+        extractor.PATTERN_WHITESPACE,
+        " ",
+        re.sub(extractor.PATTERN_CLEAN_HMTL, "", str(html_string)),
+    ).strip()
+    for k, v in extractor.BAD_CHARS_TO_REPLACE.items():
+        text = text.replace(k, v)
+    return text.strip()
+
+
+def collect_inputs(html_docs_path: str) -> list:
+    extractor = RecordingExtractor()
+    for name in sorted(os.listdir(html_docs_path)):
+        with codecs.open(os.path.join(html_docs_path, name), encoding="utf-8") as f:
+            extractor.extract_html(BeautifulSoup(f, "lxml"))
+    return [
+        x if isinstance(x, NavigableString) else str(x) for x in extractor.inputs
+    ]
+
+
+def main(html_docs_path: str):
+    extractor = HTMLExtractor()
+    inputs = collect_inputs(html_docs_path)
+    print(f"{len(inputs)} strings, {sum(len(x) for x in inputs)} characters")
+
+    mismatches = sum(
+        1 for x in inputs if clean_html_loop(extractor, x) != extractor._clean_html(x)
+    )
+    print(f"mismatches: {mismatches}")
+
+    old = min(
+        timeit.repeat(
+            lambda: [clean_html_loop(extractor, x) for x in inputs], number=1, repeat=5
+        )
+    )
+    new = min(
+        timeit.repeat(
+            lambda: [extractor._clean_html(x) for x in inputs], number=1, repeat=5
+        )
+    )
+    print(f"replace loop:      {old * 1000:8.1f} ms")
+    print(f"translation table: {new * 1000:8.1f} ms")
+    print(f"speedup:           {old / new:8.2f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else EXAMPLE_HTML)
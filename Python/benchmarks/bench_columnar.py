@@ -0,0 +1,50 @@
+# coding: UTF-8
+# Compares the columnar output format with the plain JSON one on analysis
+# outputs (example_output by default): file size, json.load time of both
+# formats and the time to decode the columnar one back into today's dicts.
+#
+#   $ python benchmarks/bench_columnar.py [path/to/output/json]
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from LawSemAnalyser.ColumnarOutput import ColumnarOutput  # noqa: E402
+
+EXAMPLE_OUTPUT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "example_output"
+)
+
+
+def dumps(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def best(function) -> float:
+    return min(timeit.repeat(function, number=1, repeat=5))
+
+
+def main(output_path: str):
+    print(
+        f"{'document':32}{'json KB':>10}{'columnar KB':>13}"
+        f"{'json ms':>10}{'columnar ms':>13}{'decode ms':>11}"
+    )
+    for name in sorted(os.listdir(output_path)):
+        with open(os.path.join(output_path, name), encoding="utf8") as f:
+            text = f.read()
+        columnar = dumps(ColumnarOutput.encode(json.loads(text)))
+        if dumps(ColumnarOutput.decode(json.loads(columnar))) != text:
+            print(f"{name}: columnar output does not decode to the original")
+        print(
+            f"{name[:31]:32}"
+            f"{len(text.encode('utf8')) / 1024:10.0f}"
+            f"{len(columnar.encode('utf8')) / 1024:13.0f}"
+            f"{best(lambda: json.loads(text)) * 1000:10.1f}"
+            f"{best(lambda: json.loads(columnar)) * 1000:13.1f}"
+            f"{best(lambda: ColumnarOutput.decode(json.loads(columnar))) * 1000:11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else EXAMPLE_OUTPUT)
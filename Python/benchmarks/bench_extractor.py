@@ -0,0 +1,67 @@
+# coding: UTF-8
+# Compares HTMLExtractor (BeautifulSoup) with LXMLExtractor on example_html:
+# parsing plus extraction of every document, and whether both produce the same
+# result JSON.
+#
+#   $ python benchmarks/bench_extractor.py [path/to/example_html]
+import codecs
+import io
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from LawSemAnalyser.HTMLExtractor import HTMLExtractor  # noqa: E402
+from LawSemAnalyser.LXMLExtractor import LXMLExtractor  # noqa: E402
+
+EXAMPLE_HTML = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "example_html"
+)
+
+
+def read_documents(html_docs_path: str) -> dict:
+    documents = {}
+    for name in sorted(os.listdir(html_docs_path)):
+        with codecs.open(os.path.join(html_docs_path, name), encoding="utf-8") as f:
+            documents[name] = f.read()
+    return documents
+
+
+def extract(extractor: HTMLExtractor, text: str) -> str:
+    tree = extractor.read_html(io.StringIO(text))
+    result = extractor.extract_html(tree).result
+    extractor.release_html(tree)
+    return json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+
+
+def main(html_docs_path: str):
+    documents = read_documents(html_docs_path)
+    print(f"{len(documents)} documents, {sum(map(len, documents.values()))} characters")
+
+    extractors = {"BeautifulSoup": HTMLExtractor(), "lxml": LXMLExtractor()}
+    mismatches = [
+        name
+        for name, text in documents.items()
+        if extract(extractors["BeautifulSoup"], text)
+        != extract(extractors["lxml"], text)
+    ]
+    print(f"mismatches: {len(mismatches)}")
+    for name in mismatches:
+        print(f"  {name}")
+
+    timings = {}
+    for name, extractor in extractors.items():
+        timings[name] = min(
+            timeit.repeat(
+                lambda: [extract(extractor, x) for x in documents.values()],
+                number=1,
+                repeat=5,
+            )
+        )
+        print(f"{name + ':':15}{timings[name] * 1000:8.1f} ms")
+    print(f"{'speedup:':15}{timings['BeautifulSoup'] / timings['lxml']:8.2f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else EXAMPLE_HTML)
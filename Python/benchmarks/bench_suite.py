@@ -0,0 +1,268 @@
+# coding: UTF-8
+# Benchmark and regression suite. example_html is replicated to each corpus
+# scale and analysed end to end with the deterministic fake Liner2 from
+# LawSemAnalyser.FakeLiner2, so nothing needs Docker or the network. The
+# stage timings come from the run report (see RunMetrics):
+#   read, extract        parsing and HTMLExtractor.extract_html
+#   liner2_prepare       writing the Liner2 inputs
+#   liner2               the fake annotator, not representative of Liner2
+#   liner2_load          merging the Liner2 output back into the elements
+#   write                serialising the results
+# plus HTMLExtractor._clean_html timed on its own. The extraction of the
+# scale 1 corpus is checked against example_output; the Liner2 output is
+# only checked for being there, since the fake one differs from the real one.
+#
+#   $ python benchmarks/bench_suite.py --scales 1,4,16 --output results.json
+#   $ python benchmarks/bench_suite.py --compare results.json
+import argparse
+import codecs
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import regex as re
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from LawSemAnalyser import SemAnalyser  # noqa: E402
+from LawSemAnalyser.ColumnarOutput import ColumnarOutput  # noqa: E402
+from LawSemAnalyser.FakeLiner2 import FakeDockerClient  # noqa: E402
+from LawSemAnalyser.HTMLExtractor import HTMLExtractor  # noqa: E402
+from LawSemAnalyser.LXMLExtractor import LXMLExtractor  # noqa: E402
+from bench_clean_html import RecordingExtractor  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+EXAMPLE_HTML = os.path.join(ROOT, "example_html")
+EXAMPLE_OUTPUT = os.path.join(ROOT, "example_output")
+EXTRACTORS = {"bs4": HTMLExtractor, "lxml": LXMLExtractor}
+STAGES = ["read", "extract", "liner2_prepare", "liner2", "liner2_load", "write"]
+# example_output was written before the replacements of BAD_CHARS_TO_REPLACE
+# lost their stray backslashes ("\<\=" instead of "<=")
+PATTERN_OLD_ESCAPE = re.compile(r"\\([-/|!^`_~:%*<>=?,.\\])")
+
+
+def build_corpus(html_docs_path: str, scale: int, corpus_path: str) -> int:
+    # scale copies of every example, under distinct names
+    size = 0
+    for name in sorted(os.listdir(html_docs_path)):
+        for i in range(scale):
+            copy_name = name if i == 0 else f"copy{i:03d}_{name}"
+            shutil.copyfile(
+                os.path.join(html_docs_path, name), os.path.join(corpus_path, copy_name)
+            )
+            size += os.path.getsize(os.path.join(corpus_path, copy_name))
+    return size
+
+
+def run_pipeline(corpus_path: str, output_path: str, extractor: str, kwargs: dict):
+    report_path = os.path.join(output_path, "report.json")
+    analyser = SemAnalyser(
+        output_path,
+        corpus_path,
+        html_extractor=EXTRACTORS[extractor](),
+        temp_path=os.path.join(output_path, "temp"),
+        docker_client=FakeDockerClient(),
+        report_path=report_path,
+        **kwargs,
+    )
+    start = time.perf_counter()
+    analyser.analyse_docs(force=True)
+    wall = time.perf_counter() - start
+    with open(report_path, encoding="utf8") as f:
+        report = json.load(f)
+    return wall, report
+
+
+def bench_scale(args, scale: int) -> dict:
+    work_path = tempfile.mkdtemp(prefix=f"lsa_bench_{scale}_")
+    try:
+        corpus_path = os.path.join(work_path, "html")
+        os.makedirs(corpus_path)
+        size = build_corpus(args.html, scale, corpus_path)
+        runs = []
+        for repeat in range(args.repeat):
+            output_path = os.path.join(work_path, f"out{repeat}")
+            runs.append(
+                run_pipeline(corpus_path, output_path, args.extractor, args.kwargs)
+            )
+        result = {
+            "documents": len(os.listdir(corpus_path)),
+            "bytes": size,
+            "wall": min(x[0] for x in runs),
+            "stages": {},
+        }
+        # the best of the repeats, stage by stage
+        for stage in STAGES:
+            timings = [x[1]["stages"][stage] for x in runs if stage in x[1]["stages"]]
+            if timings:
+                result["stages"][stage] = {
+                    "wall": min(x["wall"] for x in timings),
+                    "cpu": min(x["cpu"] for x in timings),
+                }
+        result["peak_rss"] = max(x[1].get("peak_rss", 0) for x in runs)
+        if scale == 1:
+            result["mismatches"] = check_outputs(
+                os.path.join(work_path, "out0", "json"), args.expected
+            )
+        return result
+    finally:
+        shutil.rmtree(work_path)
+
+
+def check_outputs(json_output_path: str, expected_path: str) -> list:
+    mismatches = []
+    for name in sorted(os.listdir(expected_path)):
+        path = os.path.join(json_output_path, name)
+        if not os.path.exists(path):
+            mismatches.append(f"{name}: missing")
+            continue
+        with codecs.open(os.path.join(expected_path, name), encoding="utf8") as f:
+            expected = json.load(f)
+        mismatches.extend(
+            f"{name}: {x}" for x in compare(ColumnarOutput.load(path), expected)
+        )
+    return mismatches
+
+
+def compare(result: dict, expected: dict) -> list:
+    differences = []
+    if result["type"] != expected["type"]:
+        differences.append("type")
+    for part in expected["document"]:
+        elements = result["document"].get(part, [])
+        if len(elements) != len(expected["document"][part]):
+            differences.append(f"{part}: {len(elements)} elements")
+            continue
+        for element, expected_element in zip(elements, expected["document"][part]):
+            for key in ("type", "id", "content", "links"):
+                value = expected_element[key]
+                if key == "content":
+                    value = PATTERN_OLD_ESCAPE.sub(r"\1", value)
+                if element[key] != value:
+                    differences.append(f"{part} {expected_element['id']} {key}")
+            if (element.get("liner2") is None) != (
+                expected_element.get("liner2") is None
+            ):
+                differences.append(f"{part} {expected_element['id']} liner2")
+    return differences
+
+
+def bench_clean_html(args) -> dict:
+    # the trees stay alive, so the recorded tags can be cleaned again
+    extractor = RecordingExtractor()
+    documents = []
+    for name in sorted(os.listdir(args.html)):
+        with codecs.open(os.path.join(args.html, name), encoding="utf-8") as f:
+            documents.append(extractor.read_html(f))
+        extractor.extract_html(documents[-1])
+    inputs = extractor.inputs
+    extractor = HTMLExtractor()
+    wall = min(
+        timeit.repeat(
+            lambda: [extractor._clean_html(x) for x in inputs], number=1, repeat=5
+        )
+    )
+    return {"inputs": len(inputs), "wall": wall}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(
+    results: dict, previous: dict, threshold: float, min_delta: float
+) -> list:
+    # stages that got slower by more than threshold (0.1 = 10%) and min_delta
+    # seconds at any scale
+    regressions = []
+    for scale, result in results["scales"].items():
+        old = previous["scales"].get(scale)
+        if not old:
+            continue
+        timings = [("total", result["wall"], old["wall"])] + [
+            (x, result["stages"][x]["wall"], old["stages"][x]["wall"])
+            for x in result["stages"]
+            if x in old["stages"]
+        ]
+        for stage, new_wall, old_wall in timings:
+            ratio = new_wall / old_wall if old_wall else 1.0
+            print(
+                f"scale {scale:>4} {stage:15}"
+                f"{old_wall:9.3f} s ->{new_wall:9.3f} s{ratio:7.2f}x"
+            )
+            if ratio > 1 + threshold and new_wall - old_wall > min_delta:
+                regressions.append(f"scale {scale} {stage} {ratio:.2f}x")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", default="1,4", help="comma separated, e.g. 1,4,16")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--extractor", choices=sorted(EXTRACTORS), default="bs4")
+    parser.add_argument("--html", default=EXAMPLE_HTML)
+    parser.add_argument("--expected", default=EXAMPLE_OUTPUT)
+    parser.add_argument("--output", help="where to save the results as JSON")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--min-delta", type=float, default=0.1)
+    parser.add_argument(
+        "--kwargs", type=json.loads, default={}, help="more SemAnalyser arguments, JSON"
+    )
+    args = parser.parse_args()
+
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "extractor": args.extractor,
+        "kwargs": args.kwargs,
+        "clean_html": bench_clean_html(args),
+        "scales": {},
+    }
+    print(
+        f"clean_html: {results['clean_html']['inputs']} inputs, "
+        f"{results['clean_html']['wall'] * 1000:.1f} ms"
+    )
+    for scale in (int(x) for x in args.scales.split(",")):
+        result = results["scales"][str(scale)] = bench_scale(args, scale)
+        print(
+            f"scale {scale}: {result['documents']} documents, "
+            f"{result['bytes'] / 1024 ** 2:.1f} MB, {result['wall']:.2f} s"
+        )
+        for stage, timing in result["stages"].items():
+            print(f"  {stage:15}{timing['wall']:9.3f} s wall{timing['cpu']:9.3f} s cpu")
+        for mismatch in result.get("mismatches", []):
+            print(f"  mismatch: {mismatch}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+    failed = any(x.get("mismatches") for x in results["scales"].values())
+    if args.compare:
+        with open(args.compare, encoding="utf8") as f:
+            regressions = compare_results(
+                results, json.load(f), args.threshold, args.min_delta
+            )
+        for regression in regressions:
+            print(f"regression: {regression}")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
+import logging
+
 from LawSemAnalyser import SemAnalyser
 
+# progress messages and bars; DEBUG adds a message per file
+logging.basicConfig(level=logging.INFO)
+
 # SemAnalyser("ścieżka/do/folderu/wyjściowego", "ścieżka/do/folderu/wejściowego")
 analyser = SemAnalyser("out", "example_html")
-analyser.analyse_docs()
\ No newline at end of file
+analyser.analyse_docs()
@@ -0,0 +1,41 @@
+# coding: UTF-8
+import unittest
+
+from LawSemAnalyser.FakeLiner2 import fake_liner2
+from LawSemAnalyser.Liner2Chunker import Liner2Chunker
+
+TEXTS = {
+    "a": "Ustawa z dnia 23 kwietnia 1964 r.",
+    "b": "Art. 1. Kodeks Cywilny reguluje stosunki",
+    "c": "cywilnoprawne między osobami.",
+}
+
+
+class Liner2ChunkerTest(unittest.TestCase):
+    def setUp(self):
+        self.chunker = Liner2Chunker(1000)
+        ((self.text, _),) = self.chunker.pack(TEXTS).values()
+
+    def test_split_matches_annotating_each_text(self):
+        self.assertEqual(
+            self.chunker.split(fake_liner2(self.text), TEXTS),
+            {name: fake_liner2(text) for name, text in TEXTS.items()},
+        )
+
+    def test_split_raises_on_a_differently_tokenised_marker(self):
+        # the second marker comes out as two tokens
+        text = self.text[::-1].replace(
+            Liner2Chunker.MARKER[::-1], "lsaelement boundary"[::-1], 1
+        )[::-1]
+        with self.assertRaises(ValueError):
+            self.chunker.split(fake_liner2(text), TEXTS)
+
+    def test_split_raises_when_the_tokens_do_not_match_the_text(self):
+        with self.assertRaises(ValueError):
+            self.chunker.split(
+                fake_liner2(self.text), dict(TEXTS, b="Art. 2. Kodeks Karny")
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
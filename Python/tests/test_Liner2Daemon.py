@@ -0,0 +1,85 @@
+# coding: UTF-8
+import os
+import shutil
+import tempfile
+import unittest
+
+from LawSemAnalyser import SemAnalyser
+from LawSemAnalyser.FakeLiner2 import FakeDockerClient, FakeLiner2Daemon, fake_liner2
+from LawSemAnalyser.Liner2Daemon import Liner2Daemon
+
+EXAMPLE_HTML = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "example_html"
+)
+EXAMPLE_NAME = "rozp_wdu_2020_134.html"
+
+
+def _annotate_or_fail(text: str) -> dict:
+    if "zły" in text:
+        raise ValueError("cannot annotate")
+    return fake_liner2(text)
+
+
+class Liner2DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        os.makedirs(os.path.join(self.path, "html"))
+        shutil.copy(
+            os.path.join(EXAMPLE_HTML, EXAMPLE_NAME), os.path.join(self.path, "html")
+        )
+        self.daemon = FakeLiner2Daemon(_annotate_or_fail).start()
+        self.addCleanup(self.daemon.stop)
+
+    def _analyse(self, name: str, **kwargs) -> bytes:
+        # the json output of the example, as written
+        output_path = os.path.join(self.path, name)
+        analyser = SemAnalyser(
+            output_path,
+            os.path.join(self.path, "html"),
+            temp_path=os.path.join(self.path, name + "_temp"),
+            docker_client=FakeDockerClient(),
+            **kwargs,
+        )
+        try:
+            analyser.analyse_docs(force=True)
+        finally:
+            analyser.close()
+        with open(os.path.join(output_path, "json", EXAMPLE_NAME + ".json"), "rb") as f:
+            return f.read()
+
+    def test_output_matches_batch(self):
+        self.assertEqual(
+            self._analyse(
+                "daemon",
+                liner2_backend="daemon",
+                liner2_daemon_address=self.daemon.address,
+            ),
+            self._analyse("batch"),
+        )
+
+    def test_chunked_output_matches_batch(self):
+        self.assertEqual(
+            self._analyse(
+                "daemon",
+                liner2_backend="daemon",
+                liner2_daemon_address=self.daemon.address,
+                liner2_batch_size=2000,
+            ),
+            self._analyse("batch", liner2_batch_size=2000),
+        )
+
+    def test_error_leaves_only_its_text_without_output(self):
+        daemon = Liner2Daemon(address=self.daemon.address, connections=2)
+        self.addCleanup(daemon.stop)
+        with self.assertLogs("LawSemAnalyser.Liner2Daemon", "WARNING"):
+            outputs = list(
+                daemon.annotate_many(["Dobry tekst.", "Zły tekst, zły.", "Koniec."])
+            )
+        self.assertEqual(
+            outputs, [fake_liner2("Dobry tekst."), None, fake_liner2("Koniec.")]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
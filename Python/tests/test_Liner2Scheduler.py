@@ -0,0 +1,90 @@
+# coding: UTF-8
+import os
+import shutil
+import tempfile
+import unittest
+
+from LawSemAnalyser.FakeLiner2 import FakeLiner2Runner
+from LawSemAnalyser.Liner2Scheduler import Liner2Scheduler
+
+
+class FlakyRunner(FakeLiner2Runner):
+    # fails the first run, then leaves skip without output once
+    def __init__(self, skip: str):
+        super().__init__()
+        self.skip = skip
+        self.runs = []
+
+    def run(self, input_path: str, output_path: str):
+        self.runs.append(sorted(x.name for x in os.scandir(input_path) if x.is_file()))
+        if len(self.runs) == 1:
+            raise RuntimeError("container failed")
+        super().run(input_path, output_path)
+        if len(self.runs) == 2:
+            os.remove(os.path.join(output_path, self.skip + ".json"))
+
+
+class BrokenRunner(object):
+    def __init__(self):
+        self.runs = 0
+
+    def run(self, input_path: str, output_path: str):
+        self.runs += 1
+        raise RuntimeError("container failed")
+
+
+class Liner2SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.input_path = os.path.join(self.path, "input")
+        self.output_path = os.path.join(self.path, "output")
+        os.makedirs(self.input_path)
+        os.makedirs(self.output_path)
+
+    def _write_inputs(self, texts: dict):
+        for name, text in texts.items():
+            with open(os.path.join(self.input_path, name), "w", encoding="utf8") as f:
+                f.write(text)
+
+    def test_balance_by_size(self):
+        sizes = {"a": 10, "b": 7, "c": 5, "d": 4, "e": 1}
+        shards = Liner2Scheduler.balance(sizes, 2)
+        self.assertEqual(shards, [["a", "d"], ["b", "c", "e"]])
+        self.assertEqual([sum(sizes[x] for x in shard) for shard in shards], [14, 13])
+
+    def test_balance_with_more_shards_than_inputs(self):
+        self.assertEqual(Liner2Scheduler.balance({"a": 3, "b": 5}, 4), [["b"], ["a"]])
+
+    def test_failed_shard_is_retried_with_the_files_without_output(self):
+        self._write_inputs(
+            {"a.txt": "Ala ma kota.", "b.txt": "Art. 1.", "c.txt": "Koniec."}
+        )
+        runner = FlakyRunner("b.txt")
+        with self.assertLogs("LawSemAnalyser.Liner2Scheduler", "WARNING"):
+            Liner2Scheduler([runner], retries=2).run(self.input_path, self.output_path)
+        self.assertEqual(
+            runner.runs,
+            [["a.txt", "b.txt", "c.txt"], ["a.txt", "b.txt", "c.txt"], ["b.txt"]],
+        )
+        self.assertEqual(
+            sorted(os.listdir(self.output_path)),
+            ["a.txt.json", "b.txt.json", "c.txt.json"],
+        )
+
+    def test_failed_shard_goes_to_the_next_runner(self):
+        self._write_inputs({"a.txt": "Ala ma kota.", "b.txt": "Art. 1."})
+        broken = BrokenRunner()
+        with self.assertLogs("LawSemAnalyser.Liner2Scheduler", "WARNING"):
+            Liner2Scheduler([broken, FakeLiner2Runner()], shards=2, retries=1).run(
+                self.input_path, self.output_path
+            )
+        # only shard 0 starts on the broken runner
+        self.assertEqual(broken.runs, 1)
+        self.assertEqual(
+            sorted(os.listdir(self.output_path)), ["a.txt.json", "b.txt.json"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
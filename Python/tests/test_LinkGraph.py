@@ -0,0 +1,68 @@
+# coding: UTF-8
+import os
+import tempfile
+import unittest
+
+from LawSemAnalyser.LinkGraph import LinkGraph
+
+
+def _result(elements: list) -> dict:
+    # elements are (type, id, [(address, is_external), ...])
+    return {
+        "document": {
+            "body": [
+                {
+                    "type": type_str,
+                    "id": id_str,
+                    "links": [{"address": x, "is_external": y} for x, y in links],
+                }
+                for type_str, id_str, links in elements
+            ],
+            "glossary": [],
+        }
+    }
+
+
+class LinkGraphTest(unittest.TestCase):
+    def test_first_lookup_after_adding(self):
+        graph = LinkGraph()
+        graph.add_document(
+            "a.html", _result([("article", "x", [("y", False)]), ("article", "y", [])])
+        )
+        self.assertEqual(
+            graph.links_to("a.html", "article", "y"), [("a.html", "article", "x")]
+        )
+        self.assertEqual(
+            graph.links_from("a.html", "article", "x"), [("a.html", "article", "y")]
+        )
+
+    def test_first_lookup_after_extending_a_saved_graph(self):
+        with tempfile.TemporaryDirectory() as path:
+            path = os.path.join(path, "links.json")
+            graph = LinkGraph(path)
+            graph.add_document("a.html", _result([("article", "x", [])]))
+            graph.save()
+            graph = LinkGraph(path)
+            graph.add_document(
+                "b.html",
+                _result(
+                    [
+                        ("article", "z", []),
+                        ("article", "y", [("z", False), ("x", False)]),
+                    ]
+                ),
+            )
+            self.assertEqual(
+                graph.links_from("b.html", "article", "y"),
+                # no element x in b.html, so the document itself
+                [("b.html", None, None), ("b.html", "article", "z")],
+            )
+            self.assertEqual(
+                graph.links_to("b.html", "article", "z"), [("b.html", "article", "y")]
+            )
+            graph.remove_document("b.html")
+            self.assertEqual(graph.links_to("b.html", "article", "z"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()